@@ -0,0 +1,160 @@
+# Headless rendering benchmark for graphics.py.
+#
+# Runs GraphicsEngine under SDL's dummy video driver for a fixed number of frames across shape types,
+# shape counts and screen sizes, and writes the results as JSON. The "batch" type draws the triangle case's
+# shapes from a single ShapeBatch. Frames over --budget-ms (the configured
+# fps by default) count as dropped. With --baseline it compares against a previous run and exits non-zero
+# when any case regressed by more than --threshold.
+#
+#   python bench_graphics.py --counts 100,1000,10000 --output bench.json
+#   python bench_graphics.py --set sprite_cache=true --baseline bench.json
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+import argparse, json, platform, random, sys, time, tracemalloc
+import numpy as np
+import pygame
+import graphics
+
+def make_shape(kind, rng, width, height):
+    x, y = rng.uniform(0, width), rng.uniform(0, height)
+    size = rng.uniform(5, 30)
+    color = [rng.randrange(256) for _ in range(3)]
+    if kind == "triangle":
+        return graphics.Triangle([(x, y - size), (x + size, y + size), (x - size, y + size)], color)
+    if kind == "quad":
+        return graphics.Quad([(x - size, y - size), (x + size, y - size), (x + size, y + size), (x - size, y + size)], color)
+    if kind == "circle":
+        return graphics.Circle((x, y), size, color)
+    if kind == "star":
+        return graphics.Star((x, y), size, size / 2, 5, color)
+    if kind == "polygon":
+        return graphics.Polygon((x, y), size, 6, color)
+    raise ValueError("unknown shape type %r" % kind)
+
+def move_shape(shape, rng):
+    # Nudge a shape so dirty-rect and cache paths see real mutations.
+    dx, dy = rng.uniform(-2, 2), rng.uniform(-2, 2)
+    if isinstance(shape, graphics.Circle):
+        shape.center = (shape.center[0] + dx, shape.center[1] + dy)
+    else:
+        shape.points = [(x + dx, y + dy) for x, y in shape.points]
+
+def run_case(kind, count, size, args, overrides):
+    width, height = size
+    settings = dict(graphics.SETTINGS, screen_width=width, screen_height=height, fps=0, show_stats=False)
+    settings.update(overrides)
+    rng = random.Random(args.seed)
+    tracemalloc.start()
+    engine = graphics.GraphicsEngine(settings)
+    if kind == "batch":
+        triangles = [make_shape("triangle", rng, width, height) for _ in range(count)]
+        batch = graphics.ShapeBatch(3, count)
+        batch.add_polygons([t.points for t in triangles], [t.color for t in triangles])
+        engine.add_shape(batch)
+    else:
+        shapes = [make_shape(kind, rng, width, height) for _ in range(count)]
+        for shape in shapes: engine.add_shape(shape)
+    engine.run(max_frames=1)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Churn runs once per frame as a render hook, which the engine times as part of the draw phase; it is
+    # timed here as well and taken out of the draw figures.
+    churn, churn_ms = int(count * args.churn), []
+    def mutate(alpha):
+        start = time.perf_counter()
+        if kind == "batch":
+            batch.translate([(rng.uniform(-2, 2), rng.uniform(-2, 2)) for _ in range(churn)], rng.sample(range(count), churn))
+        else:
+            for s in rng.sample(shapes, churn): move_shape(s, rng)
+        churn_ms.append((time.perf_counter() - start) * 1000)
+    if churn: engine.add_hook("render", mutate)
+    engine.run(max_frames=args.warmup)
+    engine.stats = graphics.FrameStats(args.frames, args.budget_ms)
+    del churn_ms[:]
+    start = time.perf_counter()
+    engine.run(max_frames=args.frames)
+    elapsed = time.perf_counter() - start
+    frame_ms = engine.stats.samples()
+    phases = {phase: engine.stats.percentiles(phase)["p50"] for phase in graphics.FrameStats.PHASES[:4]}
+    if churn_ms: phases["draw"] = float(np.median(engine.stats.samples("draw") - np.asarray(churn_ms)))
+    result = {
+        "case": "%s-%d-%dx%d" % (kind, count, width, height),
+        "type": kind, "count": count, "screen": [width, height],
+        "frames": args.frames,
+        "fps": args.frames / elapsed,
+        "ms_per_frame": dict(engine.stats.percentiles(), mean=float(frame_ms.mean())),
+        "phases_p50_ms": phases,
+        "churn_p50_ms": float(np.median(churn_ms)) if churn_ms else 0.0,
+        "budget_ms": args.budget_ms,
+        "dropped": engine.stats.dropped,
+        "peak_traced_kib": peak // 1024,
+    }
+    if engine.sprite_cache is not None: result["sprite_cache"] = engine.sprite_cache.stats()
+    return result
+
+def compare(results, baseline, threshold):
+    # A case regresses when fps drops or p95 frame time grows by more than threshold (a fraction).
+    previous = {r["case"]: r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        old = previous.get(r["case"])
+        if old is None: continue
+        if r["fps"] < old["fps"] * (1 - threshold):
+            regressions.append("%s: fps %.1f -> %.1f" % (r["case"], old["fps"], r["fps"]))
+        if r["ms_per_frame"]["p95"] > old["ms_per_frame"]["p95"] * (1 + threshold):
+            regressions.append("%s: p95 %.2f -> %.2f ms" % (r["case"], old["ms_per_frame"]["p95"], r["ms_per_frame"]["p95"]))
+    return regressions
+
+def parse_value(text):
+    try: return json.loads(text)
+    except ValueError: return text
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless GraphicsEngine benchmark")
+    parser.add_argument("--types", default="triangle,quad,circle,star,polygon,batch")
+    parser.add_argument("--counts", default="100,1000,10000")
+    parser.add_argument("--sizes", default="800x600,1920x1080")
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--churn", type=float, default=0.0, help="fraction of shapes moved every frame")
+    parser.add_argument("--budget-ms", type=float, help="frame budget for dropped-frame counts (default: 1000/fps)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="override a graphics setting")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--baseline", help="JSON from a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed regression, as a fraction")
+    args = parser.parse_args(argv)
+
+    overrides = dict((k, parse_value(v)) for k, v in (item.split("=", 1) for item in args.set))
+    if args.budget_ms is None:
+        fps = overrides.get("fps", graphics.SETTINGS["fps"])
+        args.budget_ms = 1000.0 / fps if fps else None
+    sizes = [tuple(int(n) for n in size.split("x")) for size in args.sizes.split(",")]
+    results = []
+    for size in sizes:
+        for kind in args.types.split(","):
+            for count in (int(n) for n in args.counts.split(",")):
+                result = run_case(kind, count, size, args, overrides)
+                results.append(result)
+                print("%-28s %8.1f fps  p95 %7.2f ms  dropped %d" % (result["case"], result["fps"], result["ms_per_frame"]["p95"],
+                      result["dropped"]), file=sys.stderr)
+    report = {
+        "meta": {"python": platform.python_version(), "pygame": pygame.version.ver, "platform": platform.platform(),
+                 "frames": args.frames, "churn": args.churn, "seed": args.seed, "settings": overrides},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f: f.write(text + "\n")
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions: print("REGRESSION " + line, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
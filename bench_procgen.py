@@ -0,0 +1,154 @@
+# Headless benchmark for procgen.py.
+#
+# Times every DungeonGenerator strategy and a cold Dungeon.find_shortest_path on the result across grid
+# sizes and fixed seeds, measures peak and retained memory with tracemalloc in a separate run (so tracing
+# does not skew the timings), and writes the results as JSON. --profile DIR saves a cProfile dump per
+# case, --trace-top N adds the top allocation sites to each result, and --baseline compares against a
+# previous run, exiting non-zero when any case regressed by more than --threshold. --check N runs N random
+# HierarchicalPathfinder queries per case (half of them after extra carves) against plain A* and exits
+# non-zero on any invalid path or disagreement about reachability.
+#
+#   python bench_procgen.py --sizes 41,256,1024 --output procgen.json
+#   python bench_procgen.py --sizes 4096 --strategies bsp,noise --seeds 1
+#   python bench_procgen.py --sizes 12x60,16x48,100 --check 200 --output /dev/null
+#   python bench_procgen.py --set connect_regions=false --baseline procgen.json
+import argparse, cProfile, json, os, platform, random, sys, time, tracemalloc
+import numpy as np
+import procgen
+
+def timings(samples):
+    samples = np.asarray(samples) * 1000.0
+    return {"min": float(samples.min()), "median": float(np.median(samples)), "mean": float(samples.mean())}
+
+def check_hierarchical(d, queries, cluster_size, seed):
+    # Number of HPA* answers that are not a valid 4-connected floor path from start to end, or that
+    # disagree with Dungeon.find_shortest_path about whether one exists.
+    rng = random.Random(seed)
+    hpa = procgen.HierarchicalPathfinder(d, cluster_size)
+    bad = 0
+    for q in range(queries):
+        if q == queries // 2:
+            for _ in range(d.w * d.h // 50 + 1): d.carve((rng.randrange(d.w), rng.randrange(d.h)))
+        if q == 0 or q == queries // 2:
+            floor = [(int(x), int(y)) for y, x in zip(*np.nonzero(d.grid))]
+        start, end = rng.choice(floor), rng.choice(floor)
+        path, expected = hpa.find_path(start, end), d.find_shortest_path(start, end)
+        valid = not path or (path[0] == start and path[-1] == end and all(
+            abs(x0 - x1) + abs(y0 - y1) == 1 and d.grid[y1, x1] for (x0, y0), (x1, y1) in zip(path, path[1:])))
+        bad += not valid or bool(path) != bool(expected)
+    hpa.close()
+    return bad
+
+def run_case(strategy, size, args, overrides):
+    width, height = size
+    settings = dict(procgen.load_settings(), grid_width=width, grid_height=height)
+    settings.update(overrides)
+    gen = procgen.DungeonGenerator(settings)
+    seeds = range(args.seed, args.seed + args.seeds)
+    generate, path, lengths = [], [], []
+    for seed in seeds:
+        start = time.perf_counter()
+        d = gen.generate(strategy, seed)
+        generate.append(time.perf_counter() - start)
+        d = procgen.Dungeon.from_bytes(d.to_bytes(packed=False))  # drop the pathfinder built during generation
+        start = time.perf_counter()
+        p = d.find_shortest_path(d.start, d.end)
+        path.append(time.perf_counter() - start)
+        lengths.append(len(p) if p else 0)
+    case = "%s-%dx%d" % (strategy, width, height)
+    tracemalloc.start(args.trace_frames)
+    d = gen.generate(strategy, args.seed)
+    d.find_shortest_path(d.start, d.end)
+    retained, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot() if args.trace_top else None
+    tracemalloc.stop()
+    result = {
+        "case": case, "strategy": strategy, "size": [width, height], "seeds": len(seeds),
+        "generate_ms": timings(generate),
+        "path_ms": timings(path),
+        "path_length_mean": float(np.mean(lengths)),
+        "floor_fraction": float(d.grid.mean()),
+        "peak_traced_kib": peak // 1024,
+        "retained_traced_kib": retained // 1024,
+    }
+    if snapshot is not None:
+        result["top_allocations"] = [{"site": str(stat.traceback), "kib": stat.size // 1024, "blocks": stat.count}
+                                     for stat in snapshot.statistics("lineno")[:args.trace_top]]
+    if args.check:
+        result["hpa_mismatches"] = check_hierarchical(gen.generate(strategy, args.seed), args.check, args.cluster_size, args.seed)
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+        profile = cProfile.Profile()
+        profile.enable()
+        d = gen.generate(strategy, args.seed)
+        d.find_shortest_path(d.start, d.end)
+        profile.disable()
+        profile.dump_stats(os.path.join(args.profile, case + ".prof"))
+    return result
+
+def compare(results, baseline, threshold):
+    # A case regresses when its median generation or path time grows by more than threshold (a fraction).
+    previous = {r["case"]: r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        old = previous.get(r["case"])
+        if old is None: continue
+        for key in ("generate_ms", "path_ms"):
+            if r[key]["median"] > old[key]["median"] * (1 + threshold):
+                regressions.append("%s: %s median %.2f -> %.2f" % (r["case"], key, old[key]["median"], r[key]["median"]))
+    return regressions
+
+def parse_value(text):
+    try: return json.loads(text)
+    except ValueError: return text
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless procgen benchmark")
+    parser.add_argument("--strategies", default=",".join(procgen.STRATEGIES))
+    parser.add_argument("--sizes", default="41,256,1024", help="grid sizes, N for square or WxH, up to 4096")
+    parser.add_argument("--seeds", type=int, default=3, help="number of seeds per case")
+    parser.add_argument("--seed", type=int, default=1234, help="first seed")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="override a procgen setting")
+    parser.add_argument("--profile", metavar="DIR", help="write a cProfile dump per case into DIR")
+    parser.add_argument("--trace-top", type=int, default=0, metavar="N", help="record the top N allocation sites")
+    parser.add_argument("--trace-frames", type=int, default=1, help="traceback depth for tracemalloc")
+    parser.add_argument("--check", type=int, default=0, metavar="N", help="check N HierarchicalPathfinder queries per case")
+    parser.add_argument("--cluster-size", type=int, default=16, help="HierarchicalPathfinder cluster size for --check")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--baseline", help="JSON from a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed regression, as a fraction")
+    args = parser.parse_args(argv)
+
+    overrides = dict((k, parse_value(v)) for k, v in (item.split("=", 1) for item in args.set))
+    results = []
+    sizes = [tuple(int(n) for n in size.split("x")) if "x" in size else (int(size), int(size)) for size in args.sizes.split(",")]
+    for size in sizes:
+        for strategy in args.strategies.split(","):
+            result = run_case(strategy, size, args, overrides)
+            results.append(result)
+            print("%-16s gen %10.2f ms  path %9.2f ms  peak %8d KiB" % (result["case"], result["generate_ms"]["median"],
+                  result["path_ms"]["median"], result["peak_traced_kib"]), file=sys.stderr)
+    report = {
+        "meta": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+                 "seeds": args.seeds, "seed": args.seed, "settings": overrides},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f: f.write(text + "\n")
+    else:
+        print(text)
+    status = 0
+    for r in results:
+        if r.get("hpa_mismatches"):
+            print("CHECK %s: %d bad HierarchicalPathfinder answers" % (r["case"], r["hpa_mismatches"]), file=sys.stderr)
+            status = 1
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions: print("REGRESSION " + line, file=sys.stderr)
+        if regressions: status = 1
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,78 +1,553 @@
-import pygame, json, math
+import pygame, json, math, time
+from collections import OrderedDict
+from functools import lru_cache, wraps
+import numpy as np
 
-# Load settings from JSON file
-with open('graphics_settings.json') as f:
-    SETTINGS = json.load(f)
+# Settings are loaded from graphics_settings.json on first use, not at import time.
+SETTINGS_FILE = 'graphics_settings.json'
+_settings = None
+
+def load_settings():
+    global _settings
+    if _settings is None:
+        with open(SETTINGS_FILE) as f:
+            _settings = json.load(f)
+    return _settings
+
+def __getattr__(name):
+    # Keeps `graphics.SETTINGS` working as a lazily loaded module attribute.
+    if name == 'SETTINGS': return load_settings()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+def _bounded_cache(setting, default):
+    # lru_cache whose maxsize comes from a setting, created on the first call.
+    def decorate(fn):
+        cached = None
+        @wraps(fn)
+        def wrapper(*args):
+            nonlocal cached
+            if cached is None: cached = lru_cache(maxsize=load_settings().get(setting, default))(fn)
+            return cached(*args)
+        return wrapper
+    return decorate
 
 # Base Shape class
 class Shape:
-    def __init__(self, color=SETTINGS["default_color"]):
-        self.color = color
+    def __init__(self, color=None, thickness=None):
+        # Constructors write straight into __dict__ (subclasses too, for their geometry): a new shape has
+        # nothing to invalidate, so the per-attribute mutation tracking below is skipped.
+        settings = _settings or load_settings()
+        d = self.__dict__
+        d["color"] = settings["default_color"] if color is None else color
+        d["thickness"] = settings["shape_thickness"] if thickness is None else thickness  # 0 fills, else outline width
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        # Public attribute assignment counts as a mutation; engine bookkeeping lives in "_" attributes. Until
+        # the shape is attached to an engine or has a memoized sprite key there is nothing to invalidate, so
+        # construction skips it.
+        if name[0] != '_':
+            d = self.__dict__
+            if '_engine' in d or '_sprite' in d: self.mark_dirty()
+    def mark_dirty(self):
+        # Call this after mutating points/color in place (e.g. shape.points[0] = ...).
+        object.__setattr__(self, '_sprite', None)
+        if not self.__dict__.get('_dirty'):
+            object.__setattr__(self, '_dirty', True)
+            engine = self.__dict__.get('_engine')
+            if engine is not None: engine._changed.append(self)
+    def get_rect(self):
+        # Integer bounding rect of the outline, padded for rounding in pygame.draw and for outline width.
+        xs = [p[0] for p in self.points]; ys = [p[1] for p in self.points]
+        left, top = math.floor(min(xs)), math.floor(min(ys))
+        pad = 1 + self.thickness
+        return pygame.Rect(left - pad, top - pad, math.ceil(max(xs)) - left + 2 * pad + 1, math.ceil(max(ys)) - top + 2 * pad + 1)
+    def collidepoint(self, point):
+        # Even-odd test against the outline.
+        x, y = point
+        inside = False
+        xj, yj = self.points[-1]
+        for xi, yi in self.points:
+            if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi: inside = not inside
+            xj, yj = xi, yi
+        return inside
+    def sprite_key(self):
+        # (key, topleft) for SpriteCache. pygame.draw truncates vertices to integers, so the key holds those
+        # integers relative to the sprite's corner: the sprite matches a direct draw pixel for pixel (except
+        # outlines cut by the target's edge, which pygame clips slightly differently) and identical shapes at
+        # any position share it. Memoized until mutated.
+        sprite = self.__dict__.get('_sprite')
+        if sprite is None:
+            points = [(int(x), int(y)) for x, y in self.points]
+            xs = [p[0] for p in points]; ys = [p[1] for p in points]
+            pad = 1 + self.thickness
+            left, top = min(xs) - pad, min(ys) - pad
+            local = tuple((x - left, y - top) for x, y in points)
+            size = (max(xs) - left + pad + 1, max(ys) - top + pad + 1)
+            sprite = ((type(self).__name__, local, tuple(self.color), self.thickness, size), (left, top))
+            object.__setattr__(self, '_sprite', sprite)
+        return sprite
+    def rasterize(self, key):
+        # Draw the geometry described by a sprite_key() key onto a new per-pixel-alpha Surface.
+        _, local, color, thickness, size = key
+        sprite = pygame.Surface(size, pygame.SRCALPHA)
+        pygame.draw.polygon(sprite, color, local, thickness)
+        return sprite
     def draw(self, surface):
         raise NotImplementedError
 
 # Basic shapes
 class Triangle(Shape):
-    def __init__(self, points, color=SETTINGS["default_color"]):
-        super().__init__(color)
-        self.points = points
+    def __init__(self, points, color=None, thickness=None):
+        super().__init__(color, thickness)
+        self.__dict__["points"] = points
     def draw(self, surface):
-        pygame.draw.polygon(surface, self.color, self.points)
+        pygame.draw.polygon(surface, self.color, self.points, self.thickness)
 
 class Quad(Shape):
-    def __init__(self, points, color=SETTINGS["default_color"]):
-        super().__init__(color)
-        self.points = points
+    def __init__(self, points, color=None, thickness=None):
+        super().__init__(color, thickness)
+        self.__dict__["points"] = points
     def draw(self, surface):
-        pygame.draw.polygon(surface, self.color, self.points)
+        pygame.draw.polygon(surface, self.color, self.points, self.thickness)
 
 class Circle(Shape):
-    def __init__(self, center, radius, color=SETTINGS["default_color"]):
-        super().__init__(color)
-        self.center, self.radius = center, radius
+    def __init__(self, center, radius, color=None, thickness=None):
+        super().__init__(color, thickness)
+        d = self.__dict__
+        d["center"], d["radius"] = center, radius
+    def get_rect(self):
+        cx, cy = self.center; r = math.ceil(self.radius)
+        return pygame.Rect(math.floor(cx) - r - 1, math.floor(cy) - r - 1, 2 * r + 3, 2 * r + 3)
+    def collidepoint(self, point):
+        return (point[0] - self.center[0]) ** 2 + (point[1] - self.center[1]) ** 2 <= self.radius ** 2
+    def sprite_key(self):
+        # Center and radius are truncated like pygame.draw.circle does, so the key is position-free.
+        sprite = self.__dict__.get('_sprite')
+        if sprite is None:
+            r = int(self.radius)
+            sprite = (('Circle', r, tuple(self.color), self.thickness), (int(self.center[0]) - r - 1, int(self.center[1]) - r - 1))
+            object.__setattr__(self, '_sprite', sprite)
+        return sprite
+    def rasterize(self, key):
+        _, r, color, thickness = key
+        sprite = pygame.Surface((2 * r + 3, 2 * r + 3), pygame.SRCALPHA)
+        pygame.draw.circle(sprite, color, (r + 1, r + 1), r, thickness)
+        return sprite
     def draw(self, surface):
-        pygame.draw.circle(surface, self.color, self.center, self.radius)
+        pygame.draw.circle(surface, self.color, self.center, self.radius, self.thickness)
 
 # Helper functions to compute vertices
 
+# Memoized unit geometry: vertex directions for a given side count and star outlines for a given
+# inner/outer ratio, radius 1 around the origin. Instances scale and translate these instead of
+# recomputing trig; the LRU bound keeps odd one-off ratios from growing the cache forever.
+@_bounded_cache("geometry_cache_size", 256)
+def unit_polygon(num_sides):
+    angle_step = 2 * math.pi / num_sides
+    return tuple((math.cos(i * angle_step), math.sin(i * angle_step)) for i in range(num_sides))
+
+@_bounded_cache("geometry_cache_size", 256)
+def unit_star(num_points, ratio):
+    # Star tips sit on every other vertex of a 2n-gon; the points between them are pulled in to `ratio`.
+    return tuple((x, y) if i % 2 == 0 else (x * ratio, y * ratio)
+                 for i, (x, y) in enumerate(unit_polygon(2 * num_points)))
+
 def star_points(center, outer_radius, inner_radius, num_points):
     cx, cy = center
-    angle_step = math.pi / num_points  # Half the angle between star tips
-    points = []
-    for i in range(2 * num_points):
-        r = outer_radius if i % 2 == 0 else inner_radius
-        angle = i * angle_step
-        x = cx + math.cos(angle) * r
-        y = cy + math.sin(angle) * r
-        points.append((x, y))
-    return points
+    if not outer_radius:
+        return star_points_many([center], [outer_radius], [inner_radius], num_points)[0].tolist()
+    unit = unit_star(num_points, inner_radius / outer_radius)
+    return [(cx + x * outer_radius, cy + y * outer_radius) for x, y in unit]
 
 def regular_polygon_points(center, radius, num_sides):
     cx, cy = center
-    angle_step = 2 * math.pi / num_sides
-    points = []
-    for i in range(num_sides):
-        angle = i * angle_step
-        x = cx + math.cos(angle) * radius
-        y = cy + math.sin(angle) * radius
-        points.append((x, y))
-    return points
+    return [(cx + x * radius, cy + y * radius) for x, y in unit_polygon(num_sides)]
+
+# Vectorized variants: vertices for many centers/radii at once, as an (n, vertices, 2) array.
+
+def star_points_many(centers, outer_radii, inner_radii, num_points):
+    radii = np.empty((len(centers), 2 * num_points))
+    radii[:, 0::2] = np.asarray(outer_radii, float)[:, None]
+    radii[:, 1::2] = np.asarray(inner_radii, float)[:, None]
+    dirs = np.array(unit_polygon(2 * num_points))
+    return np.asarray(centers, float)[:, None, :] + dirs * radii[..., None]
+
+def regular_polygon_points_many(centers, radii, num_sides):
+    dirs = np.array(unit_polygon(num_sides))
+    return np.asarray(centers, float)[:, None, :] + dirs * np.asarray(radii, float)[:, None, None]
 
 # Extended shapes
 
 class Star(Shape):
-    def __init__(self, center, outer_radius, inner_radius, num_points, color=SETTINGS["default_color"]):
-        super().__init__(color)
-        self.points = star_points(center, outer_radius, inner_radius, num_points)
+    def __init__(self, center, outer_radius, inner_radius, num_points, color=None, thickness=None):
+        super().__init__(color, thickness)
+        self.__dict__["points"] = star_points(center, outer_radius, inner_radius, num_points)
     def draw(self, surface):
-        pygame.draw.polygon(surface, self.color, self.points)
+        pygame.draw.polygon(surface, self.color, self.points, self.thickness)
 
 class Polygon(Shape):
-    def __init__(self, center, radius, num_sides, color=SETTINGS["default_color"]):
-        super().__init__(color)
-        self.points = regular_polygon_points(center, radius, num_sides)
+    def __init__(self, center, radius, num_sides, color=None, thickness=None):
+        super().__init__(color, thickness)
+        self.__dict__["points"] = regular_polygon_points(center, radius, num_sides)
+    def draw(self, surface):
+        pygame.draw.polygon(surface, self.color, self.points, self.thickness)
+
+# Struct-of-arrays container for many shapes of one kind, registered with the engine like a single shape.
+# Polygon batches keep each shape's vertices relative to its offset (so translation only touches offsets);
+# circle batches (vertex_count=None) keep an offset and a radius per shape. Indices are positions in the
+# batch and shift down when shapes before them are removed. The batch's color is the default for added
+# shapes; its thickness applies to every shape in it.
+class ShapeBatch(Shape):
+    def __init__(self, vertex_count=None, capacity=256, color=None, thickness=None):
+        super().__init__(color, thickness)
+        self.vertex_count = vertex_count
+        self._count = 0
+        self._vertices = np.zeros((capacity, vertex_count or 0, 2), np.float32)
+        self._offsets = np.zeros((capacity, 2), np.float32)
+        self._colors = np.zeros((capacity, 3), np.uint8)
+        self._radii = np.zeros(capacity, np.float32)
+    def __len__(self):
+        return self._count
+    # Live views of the used part of each buffer; call mark_dirty() after writing to them directly.
+    @property
+    def vertices(self): return self._vertices[:self._count]
+    @property
+    def offsets(self): return self._offsets[:self._count]
+    @property
+    def colors(self): return self._colors[:self._count]
+    @property
+    def radii(self): return self._radii[:self._count]
+    def _reserve(self, n):
+        capacity = len(self._offsets)
+        if self._count + n <= capacity: return
+        capacity = max(self._count + n, capacity * 2)
+        for name in ('_vertices', '_offsets', '_colors', '_radii'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], old.dtype)
+            new[:self._count] = old[:self._count]
+            object.__setattr__(self, name, new)
+    def add(self, offsets, vertices=None, radii=None, color=None):
+        # offsets: (n, 2) shape positions; vertices: (n, vertex_count, 2) relative to the offsets, or a
+        # single (vertex_count, 2) outline shared by all; radii: (n,) or scalar for circle batches;
+        # color: one RGB triple or (n, 3). Returns the indices of the new shapes.
+        if self.vertex_count is None and radii is None: raise ValueError("circle batches need radii")
+        if self.vertex_count is not None and vertices is None: raise ValueError("polygon batches need vertices")
+        offsets = np.asarray(offsets, np.float32).reshape(-1, 2)
+        n = len(offsets)
+        self._reserve(n)
+        i, j = self._count, self._count + n
+        self._offsets[i:j] = offsets
+        if self.vertex_count is None: self._radii[i:j] = radii
+        else: self._vertices[i:j] = vertices
+        self._colors[i:j] = self.color if color is None else color
+        self._count = j
+        self.mark_dirty()
+        return np.arange(i, j)
+    def add_polygons(self, points, color=None):
+        # points: (n, vertex_count, 2) in world space; each shape's offset is its vertex centroid.
+        points = np.asarray(points, np.float32)
+        offsets = points.mean(axis=1)
+        return self.add(offsets, points - offsets[:, None, :], color=color)
+    def add_stars(self, centers, outer_radii, inner_radii, color=None):
+        # For batches with vertex_count == 2 * num_points.
+        local = star_points_many(np.zeros((len(centers), 2)), outer_radii, inner_radii, self.vertex_count // 2)
+        return self.add(centers, local, color=color)
+    def add_regular_polygons(self, centers, radii, color=None):
+        local = regular_polygon_points_many(np.zeros((len(centers), 2)), radii, self.vertex_count)
+        return self.add(centers, local, color=color)
+    def remove(self, indices):
+        keep = np.ones(self._count, bool)
+        keep[indices] = False
+        n = int(keep.sum())
+        for buf in (self._vertices, self._offsets, self._colors, self._radii):
+            buf[:n] = buf[:self._count][keep]
+        self._count = n
+        self.mark_dirty()
+    def clear(self):
+        self._count = 0
+        self.mark_dirty()
+    def translate(self, delta, indices=slice(None)):
+        # delta: (dx, dy) or (n, 2) per selected shape.
+        self.offsets[indices] += np.asarray(delta, np.float32)
+        self._shapes_changed(indices)
+    def rotate(self, angle, indices=slice(None)):
+        # Rotate each selected shape about its own offset; angle in radians, scalar or per shape.
+        if self.vertex_count is None: return
+        angle = np.asarray(angle, np.float32)
+        c, s = np.cos(angle)[..., None], np.sin(angle)[..., None]
+        v = self.vertices[indices]
+        x, y = v[..., 0].copy(), v[..., 1]
+        v[..., 0] = x * c - y * s
+        v[..., 1] = x * s + y * c
+        self.vertices[indices] = v
+        self._shapes_changed(indices)
+    def scale(self, factor, indices=slice(None)):
+        # Scale each selected shape about its own offset; factor scalar or per shape.
+        factor = np.asarray(factor, np.float32)
+        if self.vertex_count is None: self.radii[indices] *= factor
+        else: self.vertices[indices] *= factor[..., None, None]
+        self._shapes_changed(indices)
+    def indices_at(self, point):
+        # Indices of the shapes containing point (even-odd rule for polygons).
+        x, y = point
+        if self.vertex_count is None:
+            d = self.offsets - np.array(point, np.float32)
+            return np.flatnonzero((d * d).sum(axis=1) <= self.radii * self.radii)
+        pts = self.vertices + self.offsets[:, None, :]
+        xi, yi = pts[..., 0], pts[..., 1]
+        xj, yj = np.roll(xi, 1, axis=1), np.roll(yi, 1, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crosses = ((yi > y) != (yj > y)) & (x < (xj - xi) * (y - yi) / (yj - yi) + xi)
+        return np.flatnonzero(crosses.sum(axis=1) % 2 == 1)
+    def collidepoint(self, point):
+        return len(self.indices_at(point)) > 0
+    def sprite_key(self):
+        return None  # already drawn in bulk; not worth rasterizing as one sprite
+    def mark_dirty(self):
+        # Also drops the cached bounds and draw lists.
+        object.__setattr__(self, '_cached', None)
+        super().mark_dirty()
+    def _shapes_changed(self, indices):
+        # After translate/rotate/scale: a small selection is re-converted in place in the cached draw lists
+        # instead of dropping them, so moving a few shapes of a large batch stays cheap.
+        cached = self.__dict__.get('_cached')
+        idx = np.arange(self._count)[indices].reshape(-1)
+        if cached is None or 4 * len(idx) > self._count:
+            self.mark_dirty(); return
+        mins, maxs, args = cached
+        mins[idx], maxs[idx], changed = self._convert(idx)
+        for i, a in zip(idx.tolist(), changed): args[i] = a
+        Shape.mark_dirty(self)
+    def _convert(self, indices):
+        # (mins, maxs, draw arguments) for the selected shapes: per-shape corners in world space, and the
+        # pygame.draw arguments with coordinates truncated to ints up front, as pygame.draw does.
+        colors = self.colors[indices].tolist()
+        offsets = self.offsets[indices]
+        if self.vertex_count is None:
+            radii = self.radii[indices]
+            r = radii[:, None]
+            return offsets - r, offsets + r, list(zip(colors, offsets.astype(np.int32).tolist(), radii.astype(np.int32).tolist()))
+        pts = self.vertices[indices] + offsets[:, None, :]
+        return pts.min(axis=1), pts.max(axis=1), list(zip(colors, pts.astype(np.int32).tolist()))
+    def _draw_data(self):
+        # _convert() for the whole batch, built once and reused until mark_dirty(), since converting the
+        # buffers to Python lists is a large part of drawing a batch.
+        cached = self.__dict__.get('_cached')
+        if cached is None:
+            cached = self._convert(slice(None))
+            object.__setattr__(self, '_cached', cached)
+        return cached
+    def get_rect(self):
+        if not self._count: return pygame.Rect(0, 0, 0, 0)
+        mins, maxs, _ = self._draw_data()
+        left, top = np.floor(mins.min(axis=0)).astype(int).tolist()
+        right, bottom = np.ceil(maxs.max(axis=0)).astype(int).tolist()
+        pad = 1 + self.thickness
+        return pygame.Rect(left - pad, top - pad, right - left + 2 * pad + 1, bottom - top + 2 * pad + 1)
     def draw(self, surface):
-        pygame.draw.polygon(surface, self.color, self.points)
+        if not self._count: return
+        mins, maxs, args = self._draw_data()
+        clip = surface.get_clip()
+        if not clip.contains(self.get_rect()):
+            # Cull against the clip rect in one vectorized pass.
+            clip = clip.inflate(2 * self.thickness, 2 * self.thickness)
+            visible = np.flatnonzero((maxs[:, 0] >= clip.left) & (mins[:, 0] < clip.right) &
+                                     (maxs[:, 1] >= clip.top) & (mins[:, 1] < clip.bottom))
+            args = [args[i] for i in visible.tolist()]
+        thickness = self.thickness
+        if self.vertex_count is None:
+            draw = pygame.draw.circle
+            for color, center, radius in args: draw(surface, color, center, radius, thickness)
+        else:
+            draw = pygame.draw.polygon
+            for color, points in args: draw(surface, color, points, thickness)
+
+# Rasterized shape cache: each distinct (shape type, geometry, color, thickness) is drawn once to a small
+# per-pixel-alpha Surface and later draws blit it. Entries are evicted least-recently-used first once the
+# cached pixels exceed max_bytes.
+class SpriteCache:
+    def __init__(self, max_bytes=None):
+        self.max_bytes = load_settings().get("sprite_cache_bytes", 16 * 1024 * 1024) if max_bytes is None else max_bytes
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()  # key -> Surface
+    def __len__(self):
+        return len(self._entries)
+    def draw(self, shape, surface):
+        sprite_key = shape.sprite_key()
+        if sprite_key is None:
+            shape.draw(surface); return
+        key, topleft = sprite_key
+        sprite = self._entries.get(key)
+        if sprite is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            self.misses += 1
+            sprite = shape.rasterize(key)
+            if pygame.display.get_surface() is not None: sprite = sprite.convert_alpha()
+            sprite.set_alpha(255, pygame.RLEACCEL)  # RLE keeps per-pixel alpha but skips transparent runs
+            size = sprite.get_width() * sprite.get_height() * sprite.get_bytesize()
+            if size <= self.max_bytes:
+                self._entries[key] = sprite
+                self.bytes += size
+                while self.bytes > self.max_bytes:
+                    _, old = self._entries.popitem(last=False)
+                    self.bytes -= old.get_width() * old.get_height() * old.get_bytesize()
+                    self.evictions += 1
+        surface.blit(sprite, topleft)
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+# Uniform-grid spatial index over bounding rects. Each item is bucketed into every cell its rect overlaps;
+# moving an item only touches the cells it leaves and enters.
+class SpatialGrid:
+    def __init__(self, cell_size=None):
+        self.cell_size = load_settings().get("spatial_cell_size", 128) if cell_size is None else cell_size
+        self._cells = {}  # (cx, cy) -> set of items
+        self._items = {}  # item -> (rect, cell span)
+    def __len__(self):
+        return len(self._items)
+    def __contains__(self, item):
+        return item in self._items
+    def _span(self, rect):
+        cs = self.cell_size
+        return (rect.left // cs, rect.top // cs, (rect.right - 1) // cs, (rect.bottom - 1) // cs)
+    def _cells_of(self, span):
+        x0, y0, x1, y1 = span
+        return [(cx, cy) for cy in range(y0, y1 + 1) for cx in range(x0, x1 + 1)]
+    def insert(self, item, rect):
+        span = self._span(rect)
+        self._items[item] = (pygame.Rect(rect), span)
+        for cell in self._cells_of(span):
+            self._cells.setdefault(cell, set()).add(item)
+    def remove(self, item):
+        _, span = self._items.pop(item)
+        for cell in self._cells_of(span):
+            bucket = self._cells[cell]
+            bucket.discard(item)
+            if not bucket: del self._cells[cell]
+    def update(self, item, rect):
+        _, old_span = self._items[item]
+        span = self._span(rect)
+        self._items[item] = (pygame.Rect(rect), span)
+        if span == old_span: return
+        old_cells, new_cells = set(self._cells_of(old_span)), set(self._cells_of(span))
+        for cell in old_cells - new_cells:
+            bucket = self._cells[cell]
+            bucket.discard(item)
+            if not bucket: del self._cells[cell]
+        for cell in new_cells - old_cells:
+            self._cells.setdefault(cell, set()).add(item)
+    def query_rect(self, rect):
+        rect = pygame.Rect(rect)
+        found = set()
+        cells = self._cells
+        for cell in self._cells_of(self._span(rect)):
+            bucket = cells.get(cell)
+            if bucket: found |= bucket
+        items = self._items
+        return {item for item in found if items[item][0].colliderect(rect)}
+    def extent(self):
+        # Pixel rect covering every occupied cell, and so every item's rect. Costs O(cells), not O(items).
+        if not self._cells: return pygame.Rect(0, 0, 0, 0)
+        xs = [cx for cx, _ in self._cells]; ys = [cy for _, cy in self._cells]
+        cs = self.cell_size
+        return pygame.Rect(min(xs) * cs, min(ys) * cs, (max(xs) - min(xs) + 1) * cs, (max(ys) - min(ys) + 1) * cs)
+    def query_outside(self, rect):
+        # Items whose rect misses rect. Only items in cells not wholly inside rect can, so the cost scales with
+        # the border of the view rather than with everything in it.
+        rect = pygame.Rect(rect)
+        cs = self.cell_size
+        x0, y0 = -(-rect.left // cs), -(-rect.top // cs)
+        x1, y1 = rect.right // cs - 1, rect.bottom // cs - 1
+        found = set()
+        for (cx, cy), bucket in self._cells.items():
+            if not (x0 <= cx <= x1 and y0 <= cy <= y1): found |= bucket
+        items = self._items
+        return {item for item in found if not items[item][0].colliderect(rect)}
+    def query_point(self, point):
+        cs = self.cell_size
+        bucket = self._cells.get((int(point[0] // cs), int(point[1] // cs)), ())
+        return {item for item in bucket if self._items[item][0].collidepoint(point)}
+
+# Draw layer: static layers are rasterized once to an offscreen Surface and re-rasterized only when one
+# of their shapes changes; dynamic layers draw their shapes each frame, culled to the visible area
+# through the layer's spatial index.
+class Layer:
+    def __init__(self, name, static=False, cell_size=None):
+        self.name, self.static = name, static
+        self.shapes = []
+        self.visible = True
+        self.index = SpatialGrid(cell_size)
+        self._surface = None
+        self._stale = True
+    def invalidate(self):
+        self._stale = True
+    def shapes_in(self, rect):
+        # Shapes whose bounding rect overlaps rect, in draw order. When rect covers most of the layer (a full
+        # redraw), self.shapes, already in draw order, is used minus whatever lies outside rect, so culling
+        # costs nothing when it removes nothing. Smaller areas go through the index.
+        rect = pygame.Rect(rect)
+        extent = self.index.extent()
+        visible = extent.clip(rect)
+        if 2 * visible.w * visible.h >= extent.w * extent.h:
+            hidden = self.index.query_outside(rect)
+            return [shape for shape in self.shapes if shape not in hidden] if hidden else self.shapes
+        return sorted(self.index.query_rect(rect), key=_draw_order)
+    def draw(self, surface, area=None, cache=None):
+        if not self.visible: return
+        if area is None: area = surface.get_clip()
+        if not self.static:
+            for shape in self.shapes_in(area):
+                if cache is None: shape.draw(surface)
+                else: cache.draw(shape, surface)
+            return
+        if self._surface is None or self._surface.get_size() != surface.get_size():
+            self._surface = pygame.Surface(surface.get_size(), pygame.SRCALPHA)
+            self._stale = True
+        if self._stale:
+            self._surface.fill((0, 0, 0, 0))
+            for shape in self.shapes_in(self._surface.get_rect()): shape.draw(self._surface)
+            self._stale = False
+        surface.blit(self._surface, area, area)
+
+def _draw_order(shape):
+    return shape._order
+
+# Per-frame timing instrumentation: milliseconds spent in each loop phase for the last `size` frames,
+# kept in a ring buffer. A frame counts as dropped when its work time exceeds the frame budget.
+class FrameStats:
+    PHASES = ("event", "update", "draw", "present", "frame")
+    def __init__(self, size=None, budget_ms=None):
+        self.size = load_settings().get("stats_frames", 600) if size is None else size
+        self.budget_ms = budget_ms
+        self.frames = 0
+        self.dropped = 0
+        self._samples = np.zeros((self.size, len(self.PHASES)))
+    def record(self, event, update, draw, present):
+        frame = event + update + draw + present
+        self._samples[self.frames % self.size] = (event, update, draw, present, frame)
+        self.frames += 1
+        if self.budget_ms and frame > self.budget_ms: self.dropped += 1
+    def reset(self):
+        self.frames = self.dropped = 0
+    def samples(self, phase="frame"):
+        return self._samples[:min(self.frames, self.size), self.PHASES.index(phase)]
+    def percentiles(self, phase="frame", q=(50, 95, 99)):
+        samples = self.samples(phase)
+        if not len(samples): return {"p%d" % p: 0.0 for p in q}
+        return {"p%d" % p: float(v) for p, v in zip(q, np.percentile(samples, q))}
+    def summary(self):
+        result = {phase: self.percentiles(phase) for phase in self.PHASES}
+        result.update(frames=self.frames, dropped=self.dropped)
+        return result
 
 # Graphics engine that manages drawing and the game loop
 class GraphicsEngine:
@@ -81,25 +556,194 @@ class GraphicsEngine:
         self.screen = pygame.display.set_mode((settings["screen_width"], settings["screen_height"]))
         self.clock = pygame.time.Clock()
         self.shapes = []
+        self.layers = []  # drawn in order, back to front
+        self.cell_size = settings.get("spatial_cell_size", 128)
+        self._layers_by_name = {}
+        self.add_layer("default")
         self.bg_color = settings["background_color"]
         self.fps = settings["fps"]
-    def add_shape(self, shape):
+        # Dirty-rect mode: only repaint areas touched by added/removed/mutated shapes.
+        self.dirty_rects = settings.get("dirty_rects", False)
+        self._changed = []        # shapes mutated since the last frame
+        self._pending_rects = []  # screen areas to repaint this frame
+        self._full_redraw = True
+        self._order = 0  # draw order of shapes within a layer
+        # Fixed-timestep updates: update hooks run at update_rate, render hooks get the interpolation factor.
+        self.timestep = 1.0 / settings.get("update_rate", 60)
+        self.max_frame_time = settings.get("max_frame_time", 0.25)  # clamp so a hitch can't snowball
+        self.alpha = 0.0
+        self.hooks = {"event": [], "update": [], "render": []}
+        self.running = False
+        self.stats = FrameStats(settings.get("stats_frames", 600), 1000.0 / self.fps if self.fps else None)
+        self.show_stats = settings.get("show_stats", False)
+        self._overlay = None
+        self._overlay_font = None
+        # Optional sprite cache for dynamic layers (static layers are already cached as a whole).
+        self.sprite_cache = SpriteCache(settings.get("sprite_cache_bytes", 16 * 1024 * 1024)) if settings.get("sprite_cache", False) else None
+    def add_layer(self, name, static=False, index=None):
+        if name in self._layers_by_name: raise ValueError("layer %r already exists" % name)
+        layer = Layer(name, static, self.cell_size)
+        self.layers.insert(len(self.layers) if index is None else index, layer)
+        self._layers_by_name[name] = layer
+        self._full_redraw = True
+        return layer
+    def get_layer(self, name):
+        return self._layers_by_name[name]
+    def add_shape(self, shape, layer="default"):
+        layer = self._layers_by_name[layer]
         self.shapes.append(shape)
-    def run(self):
-        running = True
-        while running:
+        layer.shapes.append(shape)
+        self._order += 1
+        shape._engine, shape._layer, shape._order, shape._dirty = self, layer, self._order, False
+        shape._rect = shape.get_rect()
+        layer.index.insert(shape, shape._rect)
+        if layer.static: layer.invalidate()
+        self._pending_rects.append(shape._rect)
+    def remove_shape(self, shape):
+        layer = shape._layer
+        self.shapes.remove(shape)
+        layer.shapes.remove(shape)
+        layer.index.remove(shape)
+        if layer.static: layer.invalidate()
+        self._pending_rects.append(shape._rect)
+        shape._engine = shape._layer = shape._rect = None
+    def invalidate(self, rect=None):
+        # Force a repaint of an area (or the whole screen) on the next frame.
+        if rect is None: self._full_redraw = True
+        else: self._pending_rects.append(pygame.Rect(rect))
+    def _apply_changes(self):
+        # Re-index shapes mutated since the last call and queue their old and new rects for repainting.
+        for shape in self._changed:
+            shape._dirty = False
+            if shape._engine is not self: continue  # removed after it was mutated
+            layer = shape._layer
+            if layer.static: layer.invalidate()
+            self._pending_rects.append(shape._rect)
+            shape._rect = shape.get_rect()
+            layer.index.update(shape, shape._rect)
+            self._pending_rects.append(shape._rect)
+        self._changed = []
+    def _collect_dirty_rects(self):
+        self._apply_changes()
+        rects, self._pending_rects = self._pending_rects, []
+        # Merge overlapping rects so shared areas are painted once.
+        screen_rect = self.screen.get_rect()
+        merged = []
+        for rect in rects:
+            rect = rect.clip(screen_rect)
+            if not rect.w or not rect.h: continue
+            i = rect.collidelist(merged)
+            while i != -1:
+                rect.union_ip(merged.pop(i)); i = rect.collidelist(merged)
+            merged.append(rect)
+        return merged
+    def shapes_in(self, rect):
+        # Shapes whose bounding rect overlaps rect, back to front.
+        self._apply_changes()
+        return [shape for layer in self.layers for shape in layer.shapes_in(rect)]
+    def shapes_at(self, point):
+        # Shapes whose geometry contains point, back to front (the topmost shape is last).
+        self._apply_changes()
+        found = []
+        for layer in self.layers:
+            hits = [shape for shape in layer.index.query_point(point) if shape.collidepoint(point)]
+            found.extend(sorted(hits, key=_draw_order))
+        return found
+    def add_hook(self, phase, fn):
+        # "event": fn(event) per pygame event; "update": fn(dt) per fixed step;
+        # "render": fn(alpha) before drawing, alpha in [0, 1) being how far we are into the next step.
+        self.hooks[phase].append(fn)
+    def remove_hook(self, phase, fn):
+        self.hooks[phase].remove(fn)
+    def stop(self):
+        self.running = False
+    def _update_overlay(self):
+        # Re-render the stats text a few times per second rather than every frame.
+        if self.stats.frames % 15 and self._overlay is not None: return
+        if self._overlay_font is None: self._overlay_font = pygame.font.Font(None, 20)
+        frame = self.stats.percentiles()
+        lines = ["frame p50 %.2f  p95 %.2f  p99 %.2f ms" % (frame["p50"], frame["p95"], frame["p99"]),
+                 "event %.2f  update %.2f  draw %.2f  present %.2f ms" % tuple(
+                     self.stats.percentiles(phase)["p50"] for phase in FrameStats.PHASES[:4]),
+                 "dropped %d / %d  fps %.1f" % (self.stats.dropped, self.stats.frames, self.clock.get_fps())]
+        images = [self._overlay_font.render(line, True, (255, 255, 255)) for line in lines]
+        overlay = pygame.Surface((max(i.get_width() for i in images) + 8, sum(i.get_height() for i in images) + 8))
+        overlay.set_alpha(200)
+        y = 4
+        for image in images:
+            overlay.blit(image, (4, y)); y += image.get_height()
+        if self._overlay is not None: self.invalidate(self._overlay.get_rect())
+        self.invalidate(overlay.get_rect())
+        self._overlay = overlay
+    def draw_full(self):
+        self._apply_changes()
+        self._pending_rects = []
+        self.screen.fill(self.bg_color)
+        for layer in self.layers:
+            layer.draw(self.screen, cache=self.sprite_cache)
+        if self._overlay is not None: self.screen.blit(self._overlay, (0, 0))
+    def draw_dirty(self):
+        rects = self._collect_dirty_rects()
+        for rect in rects:
+            self.screen.set_clip(rect)
+            self.screen.fill(self.bg_color, rect)
+            for layer in self.layers:
+                layer.draw(self.screen, rect, self.sprite_cache)
+            if self._overlay is not None and self._overlay.get_rect().colliderect(rect): self.screen.blit(self._overlay, (0, 0))
+        self.screen.set_clip(None)
+        return rects
+    def draw(self):
+        # Draw the frame; returns the rects to present, or None when the whole screen changed.
+        if self.show_stats: self._update_overlay()
+        elif self._overlay is not None:
+            self.invalidate(self._overlay.get_rect()); self._overlay = None
+        if self.dirty_rects and not self._full_redraw:
+            return self.draw_dirty()
+        self._full_redraw = False
+        self.draw_full()
+        return None
+    def present(self, rects):
+        if rects is None: pygame.display.flip()
+        elif rects: pygame.display.update(rects)
+    def run(self, max_frames=None):
+        self.running = True
+        clock, hooks, stats = time.perf_counter, self.hooks, self.stats
+        accumulator, previous, frames = 0.0, clock(), 0
+        while self.running and (max_frames is None or frames < max_frames):
+            t0 = clock()
+            accumulator += min(t0 - previous, self.max_frame_time)
+            previous = t0
             for event in pygame.event.get():
-                if event.type == pygame.QUIT: running = False
-            self.screen.fill(self.bg_color)
-            for shape in self.shapes:
-                shape.draw(self.screen)
-            pygame.display.flip()
+                if event.type == pygame.QUIT: self.running = False
+                if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWRESIZED): self._full_redraw = True
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3: self.show_stats = not self.show_stats
+                for hook in hooks["event"]: hook(event)
+            t1 = clock()
+            while accumulator >= self.timestep:
+                for hook in hooks["update"]: hook(self.timestep)
+                accumulator -= self.timestep
+            self.alpha = accumulator / self.timestep
+            t2 = clock()
+            for hook in hooks["render"]: hook(self.alpha)
+            rects = self.draw()
+            t3 = clock()
+            self.present(rects)
+            t4 = clock()
+            stats.record((t1 - t0) * 1000, (t2 - t1) * 1000, (t3 - t2) * 1000, (t4 - t3) * 1000)
+            frames += 1
             self.clock.tick(self.fps)
-        pygame.quit()
+        if max_frames is None: pygame.quit()
 
 # Example usage with various shapes
 if __name__ == '__main__':
+    SETTINGS = load_settings()
     engine = GraphicsEngine(SETTINGS)
+    engine.add_layer("background", static=True, index=0)
+
+    # Static background grid, rasterized once
+    for x in range(0, SETTINGS["screen_width"], 40):
+        for y in range(0, SETTINGS["screen_height"], 40):
+            engine.add_shape(Quad([(x+1, y+1), (x+39, y+1), (x+39, y+39), (x+1, y+39)], [20, 20, 30]), "background")
     
     # Basic shapes
     engine.add_shape(Triangle([(100, 100), (150, 50), (200, 100)], [255, 0, 0]))
@@ -114,5 +758,14 @@ if __name__ == '__main__':
     engine.add_shape(Polygon((500, 500), 50, 6, [255, 0, 255]))
     # Octagon (8 sides)
     engine.add_shape(Polygon((700, 300), 40, 8, [0, 255, 255]))
-    
+
+    # A batch of small triangles stored as arrays and drawn through one entry point
+    debris = ShapeBatch(3)
+    rng = np.random.default_rng(0)
+    debris.add(rng.uniform((0, 0), (800, 600), (500, 2)), np.array([(-3, 3), (0, -4), (3, 3)]), color=[120, 120, 120])
+    debris.rotate(rng.uniform(0, 2 * math.pi, 500))
+    engine.add_shape(debris)
+    engine.add_hook("update", lambda dt: debris.rotate(dt * 2.0))
+
+    # F3 toggles the frame-time overlay
     engine.run()
@@ -1,4 +1,5 @@
 import pygame, json, os
+from collections import OrderedDict
 
 # --- Load GUI settings ---
 if os.path.exists("gui_settings.json"):
@@ -19,35 +20,381 @@ else:
             "slider_track": [100, 100, 100]
         },
         "font_name": "freesansbold.ttf",
-        "font_size": 20
+        "font_size": 20,
+        "text_cache_entries": 1024,
+        "text_cache_bytes": 8388608,
+        "hit_cell_size": 64
     }
 
+# --- Fonts and rendered text ---
+# Fonts are shared process-wide, one per (name, size), so building many widgets parses each TTF once.
+# Font objects die with pygame.quit(), so the registry and the text cache are emptied then (through a
+# pygame quit hook) and whenever the font module is found uninitialised. Code that re-initialises
+# pygame.font on its own, without pygame.quit(), should call clear_fonts() itself.
+_fonts = {}
+
+def clear_fonts():
+    _fonts.clear()
+    text_cache.clear()
+
+def get_font(name=None, size=None):
+    if not pygame.font.get_init():
+        clear_fonts()
+    name = name or SETTINGS["font_name"]
+    size = size or SETTINGS["font_size"]
+    font = _fonts.get((name, size))
+    if font is None:
+        if not _fonts:
+            pygame.register_quit(clear_fonts)
+        font = _fonts[(name, size)] = pygame.font.Font(name, size)
+    return font
+
+# LRU cache of rendered text keyed by (font, text, color, antialias), bounded by entry count and by the
+# total size of the cached surfaces. Cached surfaces are shared, so callers must not draw onto them.
+class TextCache:
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries or SETTINGS.get("text_cache_entries", 1024)
+        self.max_bytes = max_bytes or SETTINGS.get("text_cache_bytes", 8 * 1024 * 1024)
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, tuple(color), antialias)
+        surf = self.entries.get(key)
+        if surf is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return surf
+        self.misses += 1
+        surf = font.render(text, antialias, color)
+        self.entries[key] = surf
+        self.bytes += surf.get_pitch() * surf.get_height()
+        while len(self.entries) > self.max_entries or (self.bytes > self.max_bytes and len(self.entries) > 1):
+            _, old = self.entries.popitem(last=False)
+            self.bytes -= old.get_pitch() * old.get_height()
+            self.evictions += 1
+        return surf
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(self.entries), "bytes": self.bytes}
+
+text_cache = TextCache()
+
+def render_text(font, text, color, antialias=True):
+    return text_cache.render(font, text, color, antialias)
+
 # --- Base Widget Class ---
+# Widgets are positioned relative to their parent: `rect` is the absolute screen rect, derived from the
+# parent-relative position and cached until something in any tree moves, so moving a widget moves its
+# whole subtree in O(1). Rects passed to constructors are absolute, as before, and are converted when a
+# widget is added to a parent. The Rect returned by `rect` is shared; move widgets by assigning `rect`
+# or calling move()/move_to() rather than mutating it.
+#
+# Widgets report visual changes with mark_dirty(), which passes the area they paint up the parent chain
+# to a UIRoot (if any) to be repainted on its next draw. Geometry changes go through layout_changed(),
+# which drops the cached subtree bounds and child hit indexes on the path to the root only. Children
+# whose area misses the surface's clip rect are skipped, so a clipped partial redraw only touches the
+# widgets under it.
+_layout_epoch = 0  # bumped whenever a widget moves; cached absolute positions from older epochs are stale
+
+def _moved():
+    global _layout_epoch
+    _layout_epoch += 1
+
+MOUSE_EVENTS = frozenset((pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP))
+KEY_EVENTS = frozenset((pygame.KEYDOWN, pygame.KEYUP, pygame.TEXTINPUT))
+
 class Widget:
     def __init__(self, rect):
-        self.rect = pygame.Rect(rect)
         self.children = []
+        self.parent = None
+        self._epoch = -1
+        self._bounds = None  # subtree bounds relative to the origin; None when stale
+        self._child_index = None  # (cx, cy) -> children, relative to the origin; None when stale
+        self.rect = rect
         self.visible = True
+    @property
+    def visible(self):
+        return self._visible
+    @visible.setter
+    def visible(self, value):
+        if value != getattr(self, "_visible", None):
+            self._visible = value
+            self.mark_dirty()
+    def origin(self):
+        # Absolute position of this widget's parent-relative coordinate origin.
+        if self._epoch != _layout_epoch:
+            x, y = self._pos
+            if self.parent is not None:
+                px, py = self.parent.origin()
+                x, y = x + px, y + py
+            self._origin = (x, y)
+            self._rect = pygame.Rect(self._origin, self._size)
+            self._epoch = _layout_epoch
+        return self._origin
+    @property
+    def rect(self):
+        self.origin()
+        return self._rect
+    @rect.setter
+    def rect(self, value):
+        value = pygame.Rect(value)
+        px, py = self.parent.origin() if self.parent is not None else (0, 0)
+        self.mark_dirty()
+        self._pos, self._size = (value.x - px, value.y - py), value.size
+        _moved()
+        self.layout_changed()
+        self.mark_dirty()
+    def move(self, dx, dy):
+        self.mark_dirty()
+        self._pos = (self._pos[0] + dx, self._pos[1] + dy)
+        _moved()
+        self.layout_changed(moved_only=True)
+        self.mark_dirty()
+    def move_to(self, x, y):
+        ox, oy = self.origin()
+        self.move(x - ox, y - oy)
     def add(self, widget):
+        ox, oy = self.origin()
+        x, y = widget.origin()
         self.children.append(widget)
+        widget.parent = self
+        widget._pos = (x - ox, y - oy)
+        _moved()
+        widget.mark_dirty()
+        self.child_layout_changed(widget)
+        self.tree_changed()
+    def remove(self, widget):
+        widget.mark_dirty()
+        x, y = widget.origin()
+        self.children.remove(widget)
+        widget.parent = None
+        widget._pos = (x, y)
+        _moved()
+        self.child_layout_changed(widget)
+        self.tree_changed()
+    def area(self):
+        # The screen area this widget paints itself (not counting children).
+        return self.rect
+    def bounds(self):
+        # The area painted by this widget and everything below it.
+        ox, oy = self.origin()
+        if self._bounds is None:
+            rect = self.area().move(-ox, -oy)
+            for child in self.children:
+                rect.union_ip(child.bounds().move(-ox, -oy))
+            self._bounds = rect
+        return self._bounds.move(ox, oy)
+    def invalidate(self, rect):
+        if self.parent is not None:
+            self.parent.invalidate(rect)
+    def mark_dirty(self):
+        if self.parent is not None:
+            self.parent.invalidate(self.bounds())
+    def layout_changed(self, moved_only=False):
+        # This widget's position, size or painted area changed. Subtree bounds are cached relative to the
+        # widget, so a plain move (moved_only) keeps them and only the ancestors have to be told.
+        if not moved_only:
+            self._bounds = None
+        if self.parent is not None:
+            self.parent.child_layout_changed(self)
+    def child_layout_changed(self, child):
+        self._child_index = None
+        self.layout_changed()
+    def tree_changed(self):
+        # The set of widgets taking part in event handling changed (add, remove, collapse).
+        if self.parent is not None:
+            self.parent.tree_changed()
+    def root(self):
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        return node
+    def capture_pointer(self):
+        # Receive every mouse event, and be the only widget to, until release_pointer().
+        root = self.root()
+        if isinstance(root, UIRoot): root.capture = self
+    def release_pointer(self):
+        root = self.root()
+        if isinstance(root, UIRoot) and root.capture is self: root.capture = None
+    # Event types this widget's on_event() handles; UIRoot only delivers these.
+    events = frozenset()
+    def on_event(self, event):
+        pass
+    def passes_events(self):
+        # Whether this widget's children take part in event handling; keep in step with event_children().
+        return True
+    def event_children(self):
+        # Children that take part in event handling.
+        return self.children
+    def children_at(self, pos):
+        # Event-taking children whose bounds contain pos, in order. Large child lists are looked up in a
+        # grid built relative to the origin, so it survives moves of this widget or its ancestors.
+        children = self.event_children()
+        if len(children) > 8:
+            size = SETTINGS.get("hit_cell_size", 64)
+            ox, oy = self.origin()
+            if self._child_index is None:
+                cells = {}
+                for child in self.children:
+                    r = child.bounds().move(-ox, -oy)
+                    for cy in range(r.top // size, (r.bottom - 1) // size + 1):
+                        for cx in range(r.left // size, (r.right - 1) // size + 1):
+                            cells.setdefault((cx, cy), []).append(child)
+                self._child_index = cells
+            children = self._child_index.get(((pos[0] - ox) // size, (pos[1] - oy) // size), ())
+        return [child for child in children if child.bounds().collidepoint(pos)]
+    def hit_test(self, pos, out=None):
+        # Widgets in this subtree with mouse handlers whose rect contains pos, in tree order (topmost last).
+        if out is None: out = []
+        if self.events & MOUSE_EVENTS and self.rect.collidepoint(pos):
+            out.append(self)
+        for child in self.children_at(pos):
+            child.hit_test(pos, out)
+        return out
     def handle_event(self, event):
-        for child in self.children:
+        # Broadcast delivery for trees driven without a UIRoot: this widget, then its children.
+        if event.type in self.events:
+            self.on_event(event)
+        for child in self.event_children():
             child.handle_event(event)
     def update(self):
         for child in self.children:
             child.update()
     def draw(self, surface):
+        clip = surface.get_clip()
         for child in self.children:
-            child.draw(surface)
+            if child.bounds().colliderect(clip):
+                child.draw(surface)
+
+# --- Retained-mode Root ---
+# Top of a widget tree that repaints only what changed. Widgets below it call mark_dirty() on visual
+# changes; draw() merges the pending areas, repaints each one under a clip rect (background first, then
+# the widgets that overlap it) and returns the rects to pass to pygame.display.update. The first draw,
+# and any after redraw_all(), repaints the whole root rect.
+#
+# UIRoot also dispatches events instead of broadcasting them. Mouse events go to the widgets under the
+# pointer, found by descending only into subtrees whose bounds contain it; motion also reaches the
+# widgets the pointer just left, so hover can end. A button press moves keyboard focus to the topmost
+# widget under the pointer that handles KEYDOWN (the previous focus gets the press too, so it can
+# deactivate), and key events go to the focused widget only. While a widget holds the pointer capture
+# (during a drag) it is the only one to get mouse events. Other event types go to the widgets subscribed
+# to them. Widgets inside a collapsed panel receive nothing, as before.
+class UIRoot(Widget):
+    def __init__(self, rect, bg_color=None):
+        self._pending = []
+        self._generation = 0  # bumped on any layout or tree change below the root
+        self._subscribers = None
+        super().__init__(rect)
+        self.bg_color = bg_color or SETTINGS["colors"]["background"]
+        self.focus = None
+        self.capture = None
+        self._hover = []
+        self.redraw_all()
+    def layout_changed(self, moved_only=False):
+        self._bounds = None
+        self._generation += 1
+    def tree_changed(self):
+        self._subscribers = None
+        self._generation += 1
+    def receives_events(self, widget):
+        # Whether widget is in this tree and not hidden from events by a collapsed ancestor.
+        node = widget
+        while node.parent is not None:
+            node = node.parent
+            if not node.passes_events(): return False
+        return node is self
+    def subscribers(self, event_type):
+        if self._subscribers is None:
+            subscribers, stack = {}, [self]
+            while stack:
+                widget = stack.pop()
+                for t in widget.events:
+                    subscribers.setdefault(t, []).append(widget)
+                stack.extend(reversed(widget.event_children()))
+            self._subscribers = subscribers
+        return self._subscribers.get(event_type, ())
+    def handle_event(self, event):
+        t = event.type
+        if t in MOUSE_EVENTS:
+            if self.capture is not None and self.receives_events(self.capture):
+                if t in self.capture.events: self.capture.on_event(event)
+                return
+            extra = []
+            if t == pygame.MOUSEMOTION: extra += self._hover
+            elif t == pygame.MOUSEBUTTONDOWN and self.focus is not None: extra.append(self.focus)
+            # A handler that changes the layout (expanding a panel, say) can expose new targets for the
+            # same event, so the hit test is redone after any such change.
+            delivered = set()
+            while True:
+                hit = [w for w in self.hit_test(event.pos) if t in w.events]
+                generation = self._generation
+                pending = [w for w in hit if w not in delivered]
+                pending += [w for w in extra if w not in delivered and w not in pending
+                            and t in w.events and self.receives_events(w)]
+                for widget in pending:
+                    delivered.add(widget)
+                    widget.on_event(event)
+                    if self._generation != generation: break
+                else:
+                    break
+            if t == pygame.MOUSEMOTION:
+                self._hover = hit
+            elif t == pygame.MOUSEBUTTONDOWN:
+                focusable = [w for w in self.hit_test(event.pos) if pygame.KEYDOWN in w.events]
+                self.focus = focusable[-1] if focusable else None
+        elif t in KEY_EVENTS:
+            # A focused widget inside a collapsed panel keeps focus but gets no keys until it is shown.
+            if self.focus is not None and t in self.focus.events and self.receives_events(self.focus):
+                self.focus.on_event(event)
+        else:
+            for widget in self.subscribers(t):
+                widget.on_event(event)
+    def invalidate(self, rect):
+        self._pending.append(pygame.Rect(rect))
+    def redraw_all(self):
+        self._pending.append(self.rect.copy())
+    def dirty_rects(self):
+        # Pending areas clipped to the root and merged so shared areas are painted once.
+        rects, self._pending = self._pending, []
+        merged = []
+        for rect in rects:
+            rect = rect.clip(self.rect)
+            if not rect.w or not rect.h: continue
+            i = rect.collidelist(merged)
+            while i != -1:
+                rect.union_ip(merged.pop(i)); i = rect.collidelist(merged)
+            merged.append(rect)
+        return merged
+    def draw(self, surface):
+        rects = self.dirty_rects()
+        for rect in rects:
+            surface.set_clip(rect)
+            surface.fill(self.bg_color, rect)
+            super().draw(surface)
+        surface.set_clip(None)
+        return rects
 
 # --- Basic Label ---
 class Label(Widget):
     def __init__(self, rect, text, font=None, color=None):
         super().__init__(rect)
         self.text = text
-        self.font = font or pygame.font.Font(SETTINGS["font_name"], SETTINGS["font_size"])
+        self.font = font or get_font()
         self.color = color or SETTINGS["colors"]["label"]
-        self.image = self.font.render(self.text, True, self.color)
+        self.image = render_text(self.font, self.text, self.color)
+    def set_text(self, text):
+        self.mark_dirty()
+        self.text = text
+        self.image = render_text(self.font, self.text, self.color)
+        self.layout_changed()
+        self.mark_dirty()
+    def area(self):
+        # The text is not clipped to the rect.
+        return self.rect.union(self.image.get_rect(topleft=self.rect.topleft))
     def draw(self, surface):
         if self.visible:
             surface.blit(self.image, self.rect)
@@ -59,17 +406,23 @@ class Button(Widget):
         super().__init__(rect)
         self.text = text
         self.callback = callback
-        self.font = font or pygame.font.Font(SETTINGS["font_name"], SETTINGS["font_size"])
+        self.font = font or get_font()
         self.color = color or SETTINGS["colors"]["button"]
         self.hover_color = hover_color or SETTINGS["colors"]["button_hover"]
         self.current_color = self.color
-        self.image = self.font.render(self.text, True, SETTINGS["colors"]["label"])
-    def handle_event(self, event):
+        self.image = render_text(self.font, self.text, SETTINGS["colors"]["label"])
+    events = frozenset((pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN))
+    def on_event(self, event):
         if event.type == pygame.MOUSEMOTION:
-            self.current_color = self.hover_color if self.rect.collidepoint(event.pos) else self.color
+            color = self.hover_color if self.rect.collidepoint(event.pos) else self.color
+            if color != self.current_color:
+                self.current_color = color
+                self.mark_dirty()
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and self.rect.collidepoint(event.pos):
             self.callback()
-        super().handle_event(event)
+    def area(self):
+        # Text wider than the button overhangs both sides.
+        return self.rect.union(self.image.get_rect(center=self.rect.center))
     def draw(self, surface):
         if self.visible:
             pygame.draw.rect(surface, self.current_color, self.rect)
@@ -96,28 +449,62 @@ class CollapsiblePanel(Panel):
         self.title = title
         self.collapse_direction = collapse_direction.lower()  # "up" or "down"
         self.collapsed = False
-        self.full_rect = self.rect.copy()
-        self.font = pygame.font.Font(SETTINGS["font_name"], SETTINGS["font_size"])
+        self.font = get_font()
         self.header_height = SETTINGS["padding"] * 2 + self.font.get_height()
         self.draggable = draggable
         self.dragging = False
         self.drag_offset = (0, 0)
     
+    @property
+    def full_rect(self):
+        # The expanded panel. Children are positioned relative to its top-left corner.
+        return Widget.rect.fget(self)
+    
+    @property
+    def rect(self):
+        # Derived from full_rect and the collapse state; assigning it sets full_rect.
+        full = self.full_rect
+        if not getattr(self, "collapsed", False):
+            return full
+        if self.collapse_direction == "down":
+            return pygame.Rect(full.x, full.y, full.width, self.header_height)
+        else:  # "up"
+            return pygame.Rect(full.x, full.bottom - self.header_height, full.width, self.header_height)
+    
+    @rect.setter
+    def rect(self, value):
+        Widget.rect.fset(self, value)
+    
     def update_rect(self):
-        # Recalculate self.rect based on full_rect and collapse state.
-        if self.collapsed:
-            if self.collapse_direction == "down":
-                self.rect = pygame.Rect(self.full_rect.x, self.full_rect.y, self.full_rect.width, self.header_height)
-            else:  # "up"
-                self.rect = pygame.Rect(self.full_rect.x, self.full_rect.bottom - self.header_height, self.full_rect.width, self.header_height)
-        else:
-            self.rect = self.full_rect.copy()
+        # rect now follows full_rect and the collapse state by itself; this only reports the change.
+        self.layout_changed()
+    
+    def area(self):
+        # The header is drawn inside full_rect whether or not the panel is collapsed.
+        return self.full_rect
+    
+    def bounds(self):
+        # Collapsed panels hide their children.
+        return self.full_rect.copy() if self.collapsed else super().bounds()
     
     def toggle(self):
+        self.mark_dirty()
         self.collapsed = not self.collapsed
-        self.update_rect()
+        self.mark_dirty()
+        # bounds() reports full_rect while collapsed, so the cached expanded bounds stay valid.
+        self.layout_changed(moved_only=True)
+        self.tree_changed()
     
-    def handle_event(self, event):
+    events = frozenset((pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP))
+    
+    def passes_events(self):
+        # Only pass events to children if expanded.
+        return not self.collapsed
+    
+    def event_children(self):
+        return self.children if self.passes_events() else []
+    
+    def on_event(self, event):
         header_margin = 5
         # Compute header rect based on full_rect.
         if self.collapse_direction == "down":
@@ -150,26 +537,17 @@ class CollapsiblePanel(Panel):
                     if self.draggable:
                         self.dragging = True
                         self.drag_offset = (event.pos[0] - self.full_rect.x, event.pos[1] - self.full_rect.y)
+                        self.capture_pointer()
                     else:
                         # If not draggable, treat header click as toggle.
                         self.toggle()
         elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
-            self.dragging = False
+            if self.dragging:
+                self.dragging = False
+                self.release_pointer()
         elif event.type == pygame.MOUSEMOTION and self.dragging:
-            # Compute delta movement.
-            old_x, old_y = self.full_rect.topleft
-            self.full_rect.x = event.pos[0] - self.drag_offset[0]
-            self.full_rect.y = event.pos[1] - self.drag_offset[1]
-            dx = self.full_rect.x - old_x
-            dy = self.full_rect.y - old_y
-            # Update child positions so they move with the panel.
-            for child in self.children:
-                child.rect.x += dx
-                child.rect.y += dy
-            self.update_rect()
-        # Only pass events to children if expanded.
-        if not self.collapsed:
-            super().handle_event(event)
+            # Children are positioned relative to the panel, so this moves the whole subtree at once.
+            self.move_to(event.pos[0] - self.drag_offset[0], event.pos[1] - self.drag_offset[1])
     
     def draw(self, surface):
         # Draw panel background.
@@ -200,7 +578,7 @@ class CollapsiblePanel(Panel):
         pygame.draw.rect(surface, header_button_color, header_rect)
         pygame.draw.rect(surface, SETTINGS["colors"]["border"], header_rect, 2)
         # Draw title text on the left.
-        title_surf = self.font.render(self.title, True, SETTINGS["colors"]["label"])
+        title_surf = render_text(self.font, self.title, SETTINGS["colors"]["label"])
         title_rect = title_surf.get_rect(midleft=(header_rect.x + header_margin, header_rect.centery))
         surface.blit(title_surf, title_rect)
         # Draw triangle icon on the right.
@@ -231,17 +609,22 @@ class TextInput(Widget):
         super().__init__(rect)
         self.text = text
         self.callback = callback
-        self.font = font or pygame.font.Font(SETTINGS["font_name"], SETTINGS["font_size"])
+        self.font = font or get_font()
         self.text_color = text_color or SETTINGS["colors"]["label"]
         self.bg_color = bg_color or SETTINGS["colors"].get("text_input_bg", [200,200,200])
         self.border_color = border_color or SETTINGS["colors"]["border"]
         self.active = False
         self.cursor_visible = True
         self.cursor_counter = 0
-    def handle_event(self, event):
+    events = frozenset((pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN))
+    def on_event(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
-            self.active = self.rect.collidepoint(event.pos)
+            active = self.rect.collidepoint(event.pos)
+            if active != self.active:
+                self.active = active
+                self.mark_dirty()
         if event.type == pygame.KEYDOWN and self.active:
+            self.mark_dirty()
             if event.key == pygame.K_RETURN:
                 if self.callback:
                     self.callback(self.text)
@@ -250,17 +633,26 @@ class TextInput(Widget):
                 self.text = self.text[:-1]
             else:
                 self.text += event.unicode
-        super().handle_event(event)
+            self.layout_changed()  # long text runs past the box, so the painted area follows it
+            self.mark_dirty()
     def update(self):
         if self.active:
             self.cursor_counter = (self.cursor_counter + 1) % 60
-            self.cursor_visible = self.cursor_counter < 30
+            cursor_visible = self.cursor_counter < 30
+            if cursor_visible != self.cursor_visible:
+                self.cursor_visible = cursor_visible
+                self.mark_dirty()
         super().update()
+    def area(self):
+        # The text is not clipped, so long input can run past the box.
+        txt_rect = render_text(self.font, self.text, self.text_color).get_rect(topleft=(self.rect.x+5, self.rect.y+5))
+        txt_rect.width += 4; txt_rect.height += 1  # room for the cursor line
+        return self.rect.union(txt_rect)
     def draw(self, surface):
         if self.visible:
             pygame.draw.rect(surface, self.bg_color, self.rect)
             pygame.draw.rect(surface, self.border_color, self.rect, 2)
-            txt_surf = self.font.render(self.text, True, self.text_color)
+            txt_surf = render_text(self.font, self.text, self.text_color)
             surface.blit(txt_surf, (self.rect.x+5, self.rect.y+5))
             if self.active and self.cursor_visible:
                 cursor_x = self.rect.x+5+txt_surf.get_width()+2
@@ -274,19 +666,22 @@ class Checkbox(Widget):
         self.text = text
         self.value = initial
         self.callback = callback
-        self.font = font or pygame.font.Font(SETTINGS["font_name"], SETTINGS["font_size"])
+        self.font = font or get_font()
         self.box_size = box_size
         self.text_color = text_color or SETTINGS["colors"]["label"]
         self.box_color = box_color or SETTINGS["colors"].get("checkbox_box", [255,255,255])
         self.check_color = check_color or SETTINGS["colors"]["button"]
-        self.image = self.font.render(self.text, True, self.text_color)
-    def handle_event(self, event):
+        self.image = render_text(self.font, self.text, self.text_color)
+    events = frozenset((pygame.MOUSEBUTTONDOWN,))
+    def on_event(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             if self.rect.collidepoint(event.pos):
                 self.value = not self.value
+                self.mark_dirty()
                 if self.callback:
                     self.callback(self.value)
-        super().handle_event(event)
+    def area(self):
+        return self.rect.union(self.image.get_rect(topleft=(self.rect.x+self.box_size+5, self.rect.y)))
     def draw(self, surface):
         if self.visible:
             box_rect = pygame.Rect(self.rect.x, self.rect.y, self.box_size, self.box_size)
@@ -308,24 +703,32 @@ class Slider(Widget):
         self.track_color = track_color or SETTINGS["colors"].get("slider_track", [100,100,100])
         self.handle_color = handle_color or SETTINGS["colors"]["button"]
         self.dragging = False
-    def handle_event(self, event):
+    events = frozenset((pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP))
+    def on_event(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             if self.rect.collidepoint(event.pos):
                 self.dragging = True
+                self.capture_pointer()
                 self.update_value(event.pos)
         elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
             if self.dragging:
                 self.dragging = False
+                self.release_pointer()
         elif event.type == pygame.MOUSEMOTION and self.dragging:
             self.update_value(event.pos)
-        super().handle_event(event)
     def update_value(self, pos):
         rel_x = pos[0] - self.rect.x
         rel_x = max(0, min(rel_x, self.rect.width))
         ratio = rel_x / self.rect.width
-        self.value = self.min + ratio * (self.max - self.min)
+        value = self.min + ratio * (self.max - self.min)
+        if value != self.value:
+            self.value = value
+            self.mark_dirty()
         if self.callback:
             self.callback(self.value)
+    def area(self):
+        # The handle (radius 10) can overhang the ends and a short track.
+        return self.rect.inflate(22, 0).union(pygame.Rect(self.rect.x, self.rect.centery - 11, 1, 22))
     def draw(self, surface):
         if self.visible:
             track_rect = pygame.Rect(self.rect.x, self.rect.centery - 5, self.rect.width, 10)
@@ -337,6 +740,71 @@ class Slider(Widget):
             pygame.draw.circle(surface, SETTINGS["colors"]["border"], handle_center, 10, 2)
         super().draw(surface)
 
+# --- Layout Containers ---
+# Row, Column and Grid position their children themselves (a child's constructor rect only gives its
+# size) and size themselves to fit. Measurement is cached against the children's sizes, and a container
+# re-arranges only when one of its own children changes; a resulting change in its own size is reported
+# to its parent in turn, so an edit deep in a tree only touches the containers on its path.
+class Layout(Widget):
+    def __init__(self, rect, spacing=None, padding=0):
+        self.spacing = SETTINGS["padding"] if spacing is None else spacing
+        self.padding = padding
+        self._measured = None  # (child sizes, child positions, own size)
+        super().__init__(rect)
+    def measure(self, sizes):
+        # Child positions (relative to the container) and the container size for children of these sizes.
+        raise NotImplementedError
+    def child_layout_changed(self, child):
+        sizes = [c._size for c in self.children]
+        if self._measured is None or self._measured[0] != sizes:
+            self._measured = (sizes,) + self.measure(sizes)
+        _, positions, size = self._measured
+        if size != self._size or any(c._pos != pos for c, pos in zip(self.children, positions)):
+            self.mark_dirty()
+            for c, pos in zip(self.children, positions):
+                c._pos = pos
+            self._size = size
+            self._bounds = None
+            _moved()
+            self.mark_dirty()
+        super().child_layout_changed(child)
+
+class Row(Layout):
+    def measure(self, sizes):
+        pad, x = self.padding, self.padding
+        positions = []
+        for w, h in sizes:
+            positions.append((x, pad))
+            x += w + self.spacing
+        width = x - self.spacing + pad if sizes else 2 * pad
+        return positions, (width, max((h for _, h in sizes), default=0) + 2 * pad)
+
+class Column(Layout):
+    def measure(self, sizes):
+        pad, y = self.padding, self.padding
+        positions = []
+        for w, h in sizes:
+            positions.append((pad, y))
+            y += h + self.spacing
+        height = y - self.spacing + pad if sizes else 2 * pad
+        return positions, (max((w for w, _ in sizes), default=0) + 2 * pad, height)
+
+class Grid(Layout):
+    # Row-major grid of equal cells, each as large as the largest child.
+    def __init__(self, rect, columns=2, spacing=None, padding=0):
+        self.columns = columns
+        super().__init__(rect, spacing, padding)
+    def measure(self, sizes):
+        pad, gap = self.padding, self.spacing
+        cell_w = max((w for w, _ in sizes), default=0)
+        cell_h = max((h for _, h in sizes), default=0)
+        positions = [(pad + (i % self.columns) * (cell_w + gap), pad + (i // self.columns) * (cell_h + gap))
+                     for i in range(len(sizes))]
+        cols = min(self.columns, len(sizes))
+        rows = -(-len(sizes) // self.columns)
+        return positions, (2 * pad + cols * cell_w + max(0, cols - 1) * gap,
+                           2 * pad + rows * cell_h + max(0, rows - 1) * gap)
+
 # --- Example: Draggable Collapsible Panel with Child GUI Elements ---
 def example_draggable_collapsible_panel():
     pygame.init()
@@ -344,20 +812,21 @@ def example_draggable_collapsible_panel():
     clock = pygame.time.Clock()
 
     # Create a collapsible panel with draggable enabled.
+    root = UIRoot(screen.get_rect())
     panel = CollapsiblePanel((50, 50, 700, 400), "Draggable Panel", collapse_direction="down", draggable=True)
     panel.add(Label((70, 100, 200, 30), "Panel Content"))
     panel.add(Button((70, 150, 150, 40), "A Button", lambda: print("Button clicked inside panel!")))
+    root.add(panel)
     
     running = True
     while running:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
-            panel.handle_event(event)
-        panel.update()
-        screen.fill(SETTINGS["colors"]["background"])
-        panel.draw(screen)
-        pygame.display.flip()
+            root.handle_event(event)
+        root.update()
+        # Only the areas that changed are repainted and pushed to the display.
+        pygame.display.update(root.draw(screen))
         clock.tick(30)
     pygame.quit()
 
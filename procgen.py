@@ -1,60 +1,721 @@
-import pygame, random, json, sys
-from collections import deque
-pygame.init()
-with open("procgen_settings.json") as f:
-    sett = json.load(f)
+import random, json, sys, math, os, tempfile, struct, hashlib, threading, time
+from concurrent.futures import ProcessPoolExecutor, CancelledError, wait, FIRST_COMPLETED
+from collections import OrderedDict, deque
+from heapq import heappush, heappop
+import numpy as np
 
-# Dungeon grid: 0 = wall, 1 = floor.
+# Importing this module has no side effects: settings are read on first use and pygame is only
+# imported by the drawing code and the demo, so level generation works on headless servers.
+SETTINGS_FILE = "procgen_settings.json"
+_settings = None
+
+def load_settings():
+    global _settings
+    if _settings is None:
+        with open(SETTINGS_FILE) as f:
+            _settings = json.load(f)
+    return _settings
+
+def __getattr__(name):
+    # Keeps `procgen.sett` working as a lazily loaded module attribute.
+    if name == "sett": return load_settings()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+# Binary level format, little-endian: a fixed header (magic, version, flags, w, h, start, end, path length;
+# a missing start/end is stored as (-1, -1)), the shortest path as int32 (x, y) pairs, then the grid either
+# bit-packed row-major (FLAG_PACKED) or as raw uint8 cells. Raw grids can be mapped straight from disk.
+DUNGEON_MAGIC = b"DUNG"
+DUNGEON_FORMAT_VERSION = 1
+FLAG_PACKED = 1
+_HEADER = struct.Struct("<4sHHIIiiiiI")
+
+# Dungeon grid: 0 = wall, 1 = floor, stored as an (h, w) uint8 array indexed grid[y, x].
 class Dungeon:
     def __init__(self, w, h):
         self.w, self.h = w, h
-        self.grid = [[0]*w for _ in range(h)]
+        self.grid = np.zeros((h, w), np.uint8)
         self.start = None
         self.end = None
         self.shortest_path = []
+        self._watchers = []  # objects told about carve() via cell_carved(x, y)
+        self._fields = OrderedDict()  # goal set -> DistanceField, least recently used first
     def in_bounds(self, pos):
         x, y = pos; return 0 <= x < self.w and 0 <= y < self.h
     def carve(self, pos):
         x, y = pos
-        if self.in_bounds(pos): self.grid[y][x] = 1
+        if self.in_bounds(pos):
+            if self._watchers and not self.grid[y, x]:
+                self.grid[y, x] = 1
+                for watcher in self._watchers: watcher.cell_carved(x, y)
+            else:
+                self.grid[y, x] = 1
+    def __getstate__(self):
+        # Watchers and search caches are rebuilt on demand; only the level itself is pickled.
+        state = dict(self.__dict__, _watchers=[], _fields=OrderedDict())
+        for name in ("_pathfinder", "_regions", "_renderer"): state.pop(name, None)
+        return state
+    def to_bytes(self, packed=True):
+        start, end = self.start or (-1, -1), self.end or (-1, -1)
+        header = _HEADER.pack(DUNGEON_MAGIC, DUNGEON_FORMAT_VERSION, FLAG_PACKED if packed else 0, self.w, self.h,
+                              start[0], start[1], end[0], end[1], len(self.shortest_path))
+        path = np.asarray(self.shortest_path, np.int32).reshape(-1, 2)
+        grid = np.packbits(self.grid.ravel()) if packed else np.ascontiguousarray(self.grid)
+        return b"".join((header, path.tobytes(), grid.tobytes()))
+    @classmethod
+    def from_bytes(cls, data, grid=None):
+        # `data` is any buffer. A raw grid is used in place when the buffer is writable (bytearray, mmap);
+        # read-only buffers are copied so the result can still be carved. `grid` lets load() supply a map.
+        magic, version, flags, w, h, sx, sy, ex, ey, n = _HEADER.unpack_from(data)
+        if magic != DUNGEON_MAGIC: raise ValueError("not a dungeon file")
+        if version != DUNGEON_FORMAT_VERSION: raise ValueError("unsupported dungeon format version %d" % version)
+        d = cls(w, h)
+        d.start = (sx, sy) if sx >= 0 else None
+        d.end = (ex, ey) if ex >= 0 else None
+        path = np.frombuffer(data, np.int32, 2 * n, _HEADER.size).reshape(-1, 2)
+        d.shortest_path = [tuple(p) for p in path.tolist()]
+        offset = _HEADER.size + 8 * n
+        if grid is not None:
+            d.grid = grid
+        elif flags & FLAG_PACKED:
+            d.grid = np.unpackbits(np.frombuffer(data, np.uint8, (w * h + 7) // 8, offset), count=w * h).reshape(h, w)
+        else:
+            d.grid = np.frombuffer(data, np.uint8, w * h, offset).reshape(h, w)
+            if not d.grid.flags.writeable: d.grid = d.grid.copy()
+        return d
+    def save(self, path, packed=True):
+        with open(path, "wb") as f: f.write(self.to_bytes(packed))
+    @classmethod
+    def load(cls, path, mmap=False):
+        # With mmap=True a raw grid is mapped copy-on-write instead of read, so loading costs no grid copy
+        # and carving never touches the file.
+        with open(path, "rb") as f:
+            if not mmap: return cls.from_bytes(bytearray(f.read()))
+            head = f.read(_HEADER.size)
+            _, _, flags, w, h, _, _, _, _, n = _HEADER.unpack(head)
+            head += f.read(8 * n)
+            if flags & FLAG_PACKED: return cls.from_bytes(head + f.read())
+        grid = np.memmap(path, np.uint8, "c", len(head), (h, w))
+        return cls.from_bytes(head, grid)
+    def watch(self, watcher):
+        self._watchers.append(watcher)
+    def unwatch(self, watcher):
+        self._watchers.remove(watcher)
+    def distance_field(self, goals, max_fields=16):
+        # Shared, cached Dijkstra map toward a set of goal cells; kept up to date as cells are carved.
+        key = frozenset(goals)
+        field = self._fields.get(key)
+        if field is None:
+            field = self._fields[key] = DistanceField(self, key)
+            while len(self._fields) > max_fields:
+                self._fields.popitem(last=False)[1].close()
+        else:
+            self._fields.move_to_end(key)
+        return field
+    @property
+    def pathfinder(self):
+        pf = self.__dict__.get("_pathfinder")
+        if pf is None: pf = self._pathfinder = Pathfinder(self)
+        return pf
+    @property
+    def regions(self):
+        index = self.__dict__.get("_regions")
+        if index is None: index = self._regions = RegionIndex(self)
+        return index
     def find_shortest_path(self, start, end):
-        q = deque([start]); came = {start: None}
-        while q:
-            cur = q.popleft()
-            if cur == end: break
-            for dx, dy in [(1,0), (-1,0), (0,1), (0,-1)]:
-                nxt = (cur[0]+dx, cur[1]+dy)
-                if self.in_bounds(nxt) and self.grid[nxt[1]][nxt[0]]==1 and nxt not in came:
-                    came[nxt] = cur; q.append(nxt)
-        if end not in came: return []
-        path = []; cur = end
-        while cur is not None:
-            path.append(cur); cur = came[cur]
-        path.reverse(); return path
+        return self.pathfinder.find_path(start, end)
     def draw(self, surf, offset, cell):
-        ox, oy = offset
-        for y in range(self.h):
-            for x in range(self.w):
-                col = (200,200,200) if self.grid[y][x]==1 else (50,50,50)
-                pygame.draw.rect(surf, col, (ox+x*cell, oy+y*cell, cell, cell))
-        # Draw shortest path in yellow
-        for pos in self.shortest_path:
-            pygame.draw.rect(surf, (255,255,0), (ox+pos[0]*cell, oy+pos[1]*cell, cell, cell))
-        # Mark start (green) and end (red)
-        if self.start:
-            pygame.draw.rect(surf, (0,255,0), (ox+self.start[0]*cell, oy+self.start[1]*cell, cell, cell))
-        if self.end:
-            pygame.draw.rect(surf, (255,0,0), (ox+self.end[0]*cell, oy+self.end[1]*cell, cell, cell))
-
-# Generator with four strategies.
+        renderer = self.__dict__.get("_renderer")
+        if renderer is None or renderer.cell != cell:
+            if renderer is not None: renderer.close()
+            renderer = self._renderer = DungeonRenderer(self, cell)
+        renderer.draw(surf, offset)
+
+# Cached rendering for Dungeon.draw. The grid is written once into an 8-bit palette surface, one pixel per
+# cell, and scaled up by the cell size; after that carve() only refills the carved cell. The path and the
+# start/end markers live on a separate colorkeyed overlay that is redrawn only when they change.
+# Writes to the grid that bypass carve() need an explicit invalidate().
+class DungeonRenderer:
+    WALL, FLOOR, PATH, START, END = (50, 50, 50), (200, 200, 200), (255, 255, 0), (0, 255, 0), (255, 0, 0)
+    def __init__(self, dungeon, cell):
+        self.dungeon = dungeon
+        self.cell = cell
+        self._grid = None
+        self._base = None
+        self._overlay = None
+        self._overlay_key = None
+        dungeon.watch(self)
+    def close(self):
+        self.dungeon.unwatch(self)
+    def invalidate(self):
+        self._grid = None
+    def cell_carved(self, x, y):
+        if self._grid is self.dungeon.grid:
+            self._base.fill(self.FLOOR, (x * self.cell, y * self.cell, self.cell, self.cell))
+    def _render_base(self):
+        import pygame
+        d = self.dungeon
+        cells = pygame.Surface((d.w, d.h), 0, 8)
+        cells.set_palette([self.WALL, self.FLOOR])
+        pygame.surfarray.blit_array(cells, d.grid.T)
+        base = pygame.transform.scale(cells, (d.w * self.cell, d.h * self.cell))
+        self._base = base.convert() if pygame.display.get_surface() is not None else base
+        self._grid = d.grid
+    def _render_overlay(self, key):
+        import pygame
+        path, start, end = key
+        overlay = pygame.Surface(self._base.get_size(), 0, 8)
+        overlay.set_palette([(0, 0, 0), self.PATH, self.START, self.END])
+        overlay.set_colorkey((0, 0, 0), pygame.RLEACCEL)
+        c = self.cell
+        for x, y in path: overlay.fill(self.PATH, (x * c, y * c, c, c))
+        if start: overlay.fill(self.START, (start[0] * c, start[1] * c, c, c))
+        if end: overlay.fill(self.END, (end[0] * c, end[1] * c, c, c))
+        self._overlay, self._overlay_key = overlay, key
+    def draw(self, surf, offset):
+        d = self.dungeon
+        if self._grid is not d.grid: self._render_base()
+        key = (tuple(map(tuple, d.shortest_path)), d.start and tuple(d.start), d.end and tuple(d.end))
+        if key != self._overlay_key or self._overlay.get_size() != self._base.get_size(): self._render_overlay(key)
+        surf.blit(self._base, offset)
+        surf.blit(self._overlay, offset)
+
+# Grid pathfinding on flat cell indices (i = y*w + x). Distance/parent buffers are allocated once per
+# dungeon and reused: each query bumps a stamp, and an entry only counts when its stamp matches, so
+# nothing has to be cleared between searches. The grid is read through a memoryview of the numpy
+# buffer, which stays in sync with carve() without copying.
+ORTHOGONAL = ((1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0))
+DIAGONAL = ORTHOGONAL + ((1, 1, math.sqrt(2)), (-1, 1, math.sqrt(2)), (1, -1, math.sqrt(2)), (-1, -1, math.sqrt(2)))
+
+class Pathfinder:
+    def __init__(self, dungeon):
+        self.dungeon = dungeon
+        self._grid = None
+        self._costs_src = self._costs = None
+        self._query = 0
+    def _sync(self):
+        d = self.dungeon
+        if self._grid is d.grid: return
+        if not d.grid.flags.c_contiguous: d.grid = np.ascontiguousarray(d.grid)
+        self._grid = d.grid
+        self._walk = d.grid.data.cast("B")
+        n = d.w * d.h
+        if len(self.__dict__.get("_stamp", ())) != n:
+            self._stamp, self._dist, self._parent = [0] * n, [0] * n, [0] * n
+    def _flat_costs(self, costs):
+        # costs: (h, w) array of per-cell entry costs >= 1. Like the grid, it is read through a memoryview,
+        # so a C-contiguous float64 map is used in place and later in-place edits (danger maps and the like)
+        # are seen by the next query. Anything else is converted on every call.
+        if costs is self._costs_src: return self._costs
+        flat = np.ascontiguousarray(costs, float).reshape(-1)
+        if np.may_share_memory(flat, costs):
+            self._costs_src, self._costs = costs, flat.data
+        return flat.data
+    def _path_to(self, t):
+        w, parent, path = self.dungeon.w, self._parent, []
+        while t != -1:
+            path.append((t % w, t // w)); t = parent[t]
+        path.reverse(); return path
+    def find_path(self, start, end, diagonal=False, costs=None, weight=1.0, bounds=None):
+        # A* from start to end over floor cells; returns the list of cells or [] if unreachable.
+        # diagonal allows 8-way moves (no corner cutting) with an octile heuristic, otherwise Manhattan.
+        # costs weights entering each cell; weight > 1 inflates the heuristic (faster, not always optimal).
+        # bounds (x0, y0, x1, y1) restricts the search to a sub-rectangle, end-exclusive.
+        self._sync()
+        d = self.dungeon; w = d.w
+        x0, y0, x1, y1 = bounds or (0, 0, d.w, d.h)
+        if not (x0 <= start[0] < x1 and y0 <= start[1] < y1 and x0 <= end[0] < x1 and y0 <= end[1] < y1): return []
+        s, t = start[1] * w + start[0], end[1] * w + end[0]
+        if s == t: return [start]
+        walk = self._walk
+        if not walk[t]: return []
+        cost = self._flat_costs(costs) if costs is not None else None
+        moves = [(dx, dy, dy * w + dx, step) for dx, dy, step in (DIAGONAL if diagonal else ORTHOGONAL)]
+        diag_h = math.sqrt(2) - 2
+        tx, ty = end
+        self._query += 1; q = self._query
+        stamp, dist, parent = self._stamp, self._dist, self._parent
+        stamp[s], dist[s], parent[s] = q, 0.0, -1
+        heap = [(0.0, 0.0, s)]
+        while heap:
+            _, neg_g, i = heappop(heap)
+            if i == t: return self._path_to(t)
+            g = -neg_g
+            if g > dist[i]: continue  # stale heap entry
+            y, x = divmod(i, w)
+            for dx, dy, di, step in moves:
+                nx, ny = x + dx, y + dy
+                if not (x0 <= nx < x1 and y0 <= ny < y1): continue
+                j = i + di
+                if not walk[j]: continue
+                if dx and dy and not (walk[i + dx] and walk[i + dy * w]): continue
+                ng = g + (step * cost[j] if cost is not None else step)
+                if stamp[j] != q or ng < dist[j]:
+                    stamp[j], dist[j], parent[j] = q, ng, i
+                    ax, ay = abs(tx - nx), abs(ty - ny)
+                    hcost = ax + ay + diag_h * min(ax, ay) if diagonal else ax + ay
+                    # Ties on f go to the deeper node, which keeps A* from fanning out on open floor.
+                    heappush(heap, (ng + weight * hcost, -ng, j))
+        return []
+    def distances(self, sources, bounds=None):
+        # Breadth-first step counts from one or more source cells over floor cells.
+        # Returns (flat distance list, visit order); entries not in the visit order are unreachable.
+        self._sync()
+        d = self.dungeon; w = d.w
+        x0, y0, x1, y1 = bounds or (0, 0, d.w, d.h)
+        walk = self._walk
+        self._query += 1; q = self._query
+        stamp, dist = self._stamp, self._dist
+        order = []
+        for x, y in sources:
+            i = y * w + x
+            if stamp[i] != q: stamp[i], dist[i] = q, 0; order.append(i)
+        moves = [(dx, dy, dy * w + dx) for dx, dy, _ in ORTHOGONAL]
+        k = 0
+        while k < len(order):
+            i = order[k]; k += 1
+            y, x = divmod(i, w)
+            di_next = dist[i] + 1
+            for dx, dy, di in moves:
+                if x0 <= x + dx < x1 and y0 <= y + dy < y1:
+                    j = i + di
+                    if walk[j] and stamp[j] != q:
+                        stamp[j], dist[j] = q, di_next; order.append(j)
+        return dist, order
+    def distance_map(self, sources):
+        # Step counts as an (h, w) int32 array, -1 where unreachable.
+        dist, order = self.distances(sources)
+        d = self.dungeon
+        out = np.full(d.w * d.h, -1, np.int32)
+        out[order] = [dist[i] for i in order]
+        return out.reshape(d.h, d.w)
+    def farthest(self, start):
+        # The reachable cell with the largest step count from start (first found on ties).
+        dist, order = self.distances([start])
+        far = order[0]
+        for i in order:
+            if dist[i] > dist[far]: far = i
+        return (far % self.dungeon.w, far // self.dungeon.w)
+
+# Dijkstra map: step distance from every floor cell to the nearest goal, computed once and shared by any
+# number of agents, each of which reads its next step in O(1). Carving only turns walls into floor, which
+# can only shorten distances, so carved cells are repaired by relaxing outward from them instead of
+# recomputing the whole field. Replacing dungeon.grid outright triggers a full recompute.
+class DistanceField:
+    def __init__(self, dungeon, goals):
+        self.dungeon = dungeon
+        self.goals = tuple(goals)
+        self._pending = []
+        self._recompute()
+        dungeon.watch(self)
+    def close(self):
+        self.dungeon.unwatch(self)
+    def cell_carved(self, x, y):
+        self._pending.append(y * self.dungeon.w + x)
+    def _recompute(self):
+        d = self.dungeon
+        dist, order = d.pathfinder.distances(self.goals)
+        own = [-1] * (d.w * d.h)
+        for i in order: own[i] = dist[i]
+        self._dist, self._grid, self._pending = own, d.grid, []
+    def _sync(self):
+        if self._grid is not self.dungeon.grid: self._recompute()
+        elif self._pending: self._repair()
+    def _repair(self):
+        d = self.dungeon; w, h = d.w, d.h
+        walk, dist = d.grid.data.cast("B"), self._dist
+        queue = deque()
+        for i in self._pending:
+            y, x = divmod(i, w)
+            best = dist[i] if dist[i] >= 0 else None
+            for dx, dy, _ in ORTHOGONAL:
+                if 0 <= x + dx < w and 0 <= y + dy < h:
+                    n = dist[i + dy * w + dx]
+                    if n >= 0 and (best is None or n + 1 < best): best = n + 1
+            if best is not None and best != dist[i]: dist[i] = best
+            if dist[i] >= 0: queue.append(i)
+        self._pending = []
+        while queue:
+            i = queue.popleft()
+            y, x = divmod(i, w)
+            nd = dist[i] + 1
+            for dx, dy, _ in ORTHOGONAL:
+                if 0 <= x + dx < w and 0 <= y + dy < h:
+                    j = i + dy * w + dx
+                    if walk[j] and (dist[j] < 0 or dist[j] > nd):
+                        dist[j] = nd; queue.append(j)
+    def distance(self, pos):
+        # Steps to the nearest goal, or -1 if no goal is reachable.
+        self._sync()
+        return self._dist[pos[1] * self.dungeon.w + pos[0]]
+    def next_step(self, pos):
+        # The neighbouring cell one step closer to a goal, or None at a goal or when unreachable.
+        self._sync()
+        w, h = self.dungeon.w, self.dungeon.h
+        x, y = pos
+        here = self._dist[y * w + x]
+        if here <= 0: return None
+        for dx, dy, _ in ORTHOGONAL:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < w and 0 <= ny < h and self._dist[ny * w + nx] == here - 1: return (nx, ny)
+        return None
+    def as_array(self):
+        self._sync()
+        return np.array(self._dist, np.int32).reshape(self.dungeon.h, self.dungeon.w)
+
+# Hierarchical pathfinding (HPA*). The grid is split into cluster_size x cluster_size clusters; where floor
+# runs across a cluster border, entrance cell pairs become nodes of an abstract graph, joined by
+# intra-cluster step counts. Queries search the small abstract graph and then refine each hop with a
+# local A* bounded to one cluster. Carving only rebuilds the cluster it lands in (plus the neighbouring
+# cluster when it touches their shared border).
+class HierarchicalPathfinder:
+    def __init__(self, dungeon, cluster_size=16):
+        self.dungeon = dungeon
+        self.cluster_size = cluster_size
+        self._grid = None
+        self._dirty, self._dirty_borders = set(), set()
+        dungeon.watch(self)
+    def close(self):
+        self.dungeon.unwatch(self)
+    def cell_carved(self, x, y):
+        if self._grid is not self.dungeon.grid: return  # a full rebuild is already due
+        cs = self.cluster_size
+        cx, cy = x // cs, y // cs
+        c = self._cluster_id(cx, cy)
+        self._dirty.add(c)
+        if x % cs == 0 and cx > 0: self._dirty_borders.add((c - 1, c))
+        if x % cs == cs - 1 and cx < self._ncx - 1: self._dirty_borders.add((c, c + 1))
+        if y % cs == 0 and cy > 0: self._dirty_borders.add((c - self._ncx, c))
+        if y % cs == cs - 1 and cy < self._ncy - 1: self._dirty_borders.add((c, c + self._ncx))
+    def _cluster_id(self, cx, cy):
+        return cy * self._ncx + cx
+    def _cluster_of(self, i):
+        y, x = divmod(i, self.dungeon.w)
+        return self._cluster_id(x // self.cluster_size, y // self.cluster_size)
+    def _bounds(self, c):
+        cs, d = self.cluster_size, self.dungeon
+        cy, cx = divmod(c, self._ncx)
+        return (cx * cs, cy * cs, min((cx + 1) * cs, d.w), min((cy + 1) * cs, d.h))
+    def _cluster_borders(self, c):
+        cy, cx = divmod(c, self._ncx)
+        if cx > 0: yield (c - 1, c)
+        if cx < self._ncx - 1: yield (c, c + 1)
+        if cy > 0: yield (c - self._ncx, c)
+        if cy < self._ncy - 1: yield (c, c + self._ncx)
+    def _scan_border(self, key):
+        # Entrance pairs (cell in a, cell in b) along the border between clusters a and b: one per floor run,
+        # or one at each end of runs of 6 cells or more.
+        a, b = key
+        w, walk = self.dungeon.w, self._walk
+        ax0, ay0, ax1, ay1 = self._bounds(a)
+        bx0, by0, bx1, by1 = self._bounds(b)
+        # Compare grid rows rather than ids: in a map one cluster wide, the cluster below is also a + 1.
+        if ay0 == by0:  # a left of b: column ax1-1 against column bx0
+            cells = [(y * w + ax1 - 1, y * w + bx0) for y in range(ay0, ay1)]
+        else:           # a above b: row ay1-1 against row by0
+            cells = [((ay1 - 1) * w + x, by0 * w + x) for x in range(ax0, ax1)]
+        pairs, run = [], []
+        for pair in cells + [None]:
+            if pair is not None and walk[pair[0]] and walk[pair[1]]:
+                run.append(pair); continue
+            if run:
+                pairs.extend([run[0], run[-1]] if len(run) >= 6 else [run[len(run) // 2]])
+                run = []
+        return pairs
+    def _set_border(self, key, pairs):
+        inter = self._inter
+        for u, v in self._borders.get(key, ()):
+            inter[u].discard(v); inter[v].discard(u)
+            if not inter[u]: del inter[u]
+            if not inter[v]: del inter[v]
+        self._borders[key] = pairs
+        for u, v in pairs:
+            inter.setdefault(u, set()).add(v); inter.setdefault(v, set()).add(u)
+    def _local_graph(self, c):
+        # Adjacency lists of the cluster's floor cells in cluster-local indices, so the many small searches
+        # per cluster skip bounds and wall checks.
+        x0, y0, x1, y1 = self._bounds(c)
+        bw = x1 - x0
+        walk = self._grid[y0:y1, x0:x1].ravel().tolist()
+        n = len(walk)
+        adj = [None] * n
+        for i in range(n):
+            if walk[i]:
+                x = i % bw
+                adj[i] = [j for j, ok in ((i - 1, x > 0), (i + 1, x < bw - 1), (i - bw, i >= bw), (i + bw, i + bw < n))
+                          if ok and walk[j]]
+        return adj, x0, y0, bw
+    def _local_steps(self, graph, source, targets):
+        # {target: steps} for the flat targets reachable from flat source without leaving the cluster.
+        adj, x0, y0, bw = graph
+        w = self.dungeon.w
+        def local(i):
+            y, x = divmod(i, w); return (y - y0) * bw + (x - x0)
+        s = local(source)
+        dist = [-1] * len(adj)
+        dist[s] = 0
+        queue = [s] if adj[s] is not None else []
+        for i in queue:
+            nd = dist[i] + 1
+            for j in adj[i]:
+                if dist[j] < 0: dist[j] = nd; queue.append(j)
+        found = {}
+        for t in targets:
+            k = dist[local(t)]
+            if k >= 0: found[t] = k
+        return found
+    def _build_cluster(self, c):
+        # Nodes are this cluster's entrance cells; edges are step counts between them inside the cluster.
+        nodes = set()
+        for key in self._cluster_borders(c):
+            side = 0 if key[0] == c else 1
+            nodes.update(pair[side] for pair in self._borders.get(key, ()))
+        edges = {n: [] for n in nodes}
+        if len(nodes) > 1:
+            graph = self._local_graph(c)
+            # Step counts are symmetric, so each node only searches for the nodes after it.
+            order = sorted(nodes)
+            for k, n in enumerate(order[:-1]):
+                for m, steps in self._local_steps(graph, n, order[k + 1:]).items():
+                    edges[n].append((m, steps)); edges[m].append((n, steps))
+        self._intra[c] = edges
+    def _rebuild(self, clusters, borders):
+        affected = set(clusters)
+        for key in borders:
+            self._set_border(key, self._scan_border(key)); affected.update(key)
+        for c in affected: self._build_cluster(c)
+    def _sync(self):
+        d = self.dungeon
+        if self._grid is not d.grid:
+            d.pathfinder._sync()
+            self._grid, self._walk = d.grid, d.grid.data.cast("B")
+            cs = self.cluster_size
+            self._ncx, self._ncy = -(-d.w // cs), -(-d.h // cs)
+            self._borders, self._inter, self._intra = {}, {}, {}
+            clusters = range(self._ncx * self._ncy)
+            self._rebuild(clusters, {key for c in clusters for key in self._cluster_borders(c)})
+        elif self._dirty or self._dirty_borders:
+            self._rebuild(self._dirty, self._dirty_borders)
+        self._dirty, self._dirty_borders = set(), set()
+    def abstract_path(self, start, end):
+        # Waypoints (start, entrance cells..., end) of the abstract route, or [] if unreachable.
+        self._sync()
+        d = self.dungeon; w = d.w
+        if not (d.in_bounds(start) and d.in_bounds(end)): return []
+        s, t = start[1] * w + start[0], end[1] * w + end[0]
+        if s == t: return [start]
+        if not self._walk[t]: return []
+        cs, ct = self._cluster_of(s), self._cluster_of(t)
+        # Temporary edges linking start and end to the entrances of their clusters (and to each other
+        # when they share one; the abstract search still considers routes that leave the cluster).
+        s_graph = self._local_graph(cs)
+        s_targets = list(self._intra[cs]) + ([t] if cs == ct else [])
+        s_edges = [(m, k) for m, k in self._local_steps(s_graph, s, s_targets).items() if m != s]
+        t_graph = s_graph if cs == ct else self._local_graph(ct)
+        t_edges = {m: k for m, k in self._local_steps(t_graph, t, self._intra[ct]).items() if m != t}
+        tx, ty = end
+        g, parent = {s: 0}, {s: None}
+        heap = [(0, 0, s)]
+        while heap:
+            _, neg_g, n = heappop(heap)
+            if n == t: break
+            cost = -neg_g
+            if cost > g[n]: continue
+            if n == s: edges = s_edges + [(m, 1) for m in self._inter.get(n, ())]
+            else:
+                edges = self._intra[self._cluster_of(n)].get(n, []) + [(m, 1) for m in self._inter.get(n, ())]
+                if n in t_edges: edges = edges + [(t, t_edges[n])]
+            for m, k in edges:
+                ng = cost + k
+                if ng < g.get(m, ng + 1):
+                    g[m], parent[m] = ng, n
+                    my, mx = divmod(m, w)
+                    heappush(heap, (ng + abs(tx - mx) + abs(ty - my), -ng, m))
+        else:
+            return []
+        route = []
+        while t is not None:
+            route.append((t % w, t // w)); t = parent[t]
+        route.reverse()
+        return route
+    def find_path(self, start, end):
+        # Full cell path: the abstract route refined hop by hop inside single clusters. Nearby endpoints
+        # first try a direct search over their two clusters, which avoids detours through entrances.
+        pf, w = self.dungeon.pathfinder, self.dungeon.w
+        if abs(start[0] - end[0]) + abs(start[1] - end[1]) <= self.cluster_size and self.dungeon.in_bounds(start) and self.dungeon.in_bounds(end):
+            self._sync()
+            a = self._bounds(self._cluster_of(start[1] * w + start[0]))
+            b = self._bounds(self._cluster_of(end[1] * w + end[0]))
+            path = pf.find_path(start, end, bounds=(min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])))
+            if path: return path
+        route = self.abstract_path(start, end)
+        if len(route) < 2: return route
+        path = [route[0]]
+        for a, b in zip(route, route[1:]):
+            ca, cb = self._cluster_of(a[1] * w + a[0]), self._cluster_of(b[1] * w + b[0])
+            if ca != cb: path.append(b)  # entrance pair across a border
+            else: path.extend(pf.find_path(a, b, bounds=self._bounds(ca))[1:])
+        return path
+
+# Connected floor regions (4-connected). The initial labelling is vectorized: floor cells are grouped into
+# horizontal runs with numpy, vertically touching runs are joined by a union-find over run ids, and the
+# result is scattered back to a per-cell label array. Carving joins regions through a union-find over
+# labels, so updates are O(1) amortized and same_region() is two lookups. Bounding boxes are
+# (x0, y0, x1, y1), end-exclusive.
+class RegionIndex:
+    def __init__(self, dungeon):
+        self.dungeon = dungeon
+        self._grid = None
+        dungeon.watch(self)
+    def close(self):
+        self.dungeon.unwatch(self)
+    def _relabel(self):
+        grid = self.dungeon.grid
+        h, w = grid.shape
+        floor = grid.astype(bool)
+        starts = floor.copy()
+        starts[:, 1:] &= ~floor[:, :-1]
+        run_of = np.cumsum(starts.ravel()) - 1
+        runs = int(starts.sum())
+        vertical = (floor[:-1] & floor[1:]).ravel()
+        pairs = np.unique(np.stack([run_of[:-w][vertical], run_of[w:][vertical]], axis=1), axis=0)
+        parent = list(range(runs))
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]; i = parent[i]
+            return i
+        for a, b in pairs.tolist():
+            ra, rb = find(a), find(b)
+            if ra != rb: parent[max(ra, rb)] = min(ra, rb)
+        roots = np.array([find(i) for i in range(runs)], np.int64)
+        _, run_label = np.unique(roots, return_inverse=True)
+        cells = np.flatnonzero(floor)
+        cell_label = run_label[run_of[cells]]
+        labels = np.full(h * w, -1, np.int32)
+        labels[cells] = cell_label
+        n = int(cell_label.max()) + 1 if len(cells) else 0
+        ys, xs = np.divmod(cells, w)
+        x0 = np.full(n, w); y0 = np.full(n, h); x1 = np.zeros(n, int); y1 = np.zeros(n, int)
+        np.minimum.at(x0, cell_label, xs); np.minimum.at(y0, cell_label, ys)
+        np.maximum.at(x1, cell_label, xs + 1); np.maximum.at(y1, cell_label, ys + 1)
+        first = np.full(n, h * w); np.minimum.at(first, cell_label, cells)
+        self._labels = labels.reshape(h, w)
+        self._parent = list(range(n))
+        self._size = np.bincount(cell_label, minlength=n).tolist()
+        self._bbox = [list(b) for b in zip(x0.tolist(), y0.tolist(), x1.tolist(), y1.tolist())]
+        self._first = first.tolist()  # lowest flat index of each region, a stable representative cell
+        self._count = n
+        self._grid = grid
+    def _sync(self):
+        if self._grid is not self.dungeon.grid: self._relabel()
+    def _find(self, label):
+        parent = self._parent
+        while parent[label] != label:
+            parent[label] = parent[parent[label]]; label = parent[label]
+        return label
+    def _union(self, a, b):
+        a, b = self._find(a), self._find(b)
+        if a == b: return a
+        if self._size[a] < self._size[b]: a, b = b, a
+        self._parent[b] = a
+        self._size[a] += self._size[b]
+        ba, bb = self._bbox[a], self._bbox[b]
+        self._bbox[a] = [min(ba[0], bb[0]), min(ba[1], bb[1]), max(ba[2], bb[2]), max(ba[3], bb[3])]
+        self._first[a] = min(self._first[a], self._first[b])
+        self._count -= 1
+        return a
+    def cell_carved(self, x, y):
+        if self._grid is not self.dungeon.grid: return  # relabelled from scratch on next use
+        d, labels = self.dungeon, self._labels
+        label = len(self._parent)
+        self._parent.append(label); self._size.append(1)
+        self._bbox.append([x, y, x + 1, y + 1]); self._first.append(y * d.w + x)
+        self._count += 1
+        for dx, dy, _ in ORTHOGONAL:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < d.w and 0 <= ny < d.h and labels[ny, nx] >= 0:
+                label = self._union(label, int(labels[ny, nx]))
+        labels[y, x] = label
+    @property
+    def count(self):
+        self._sync()
+        return self._count
+    def label(self, pos):
+        # Region id of a floor cell, or -1 for walls and out-of-bounds cells.
+        self._sync()
+        if not self.dungeon.in_bounds(pos): return -1
+        label = int(self._labels[pos[1], pos[0]])
+        return self._find(label) if label >= 0 else -1
+    def same_region(self, a, b):
+        la = self.label(a)
+        return la >= 0 and la == self.label(b)
+    def size(self, label):
+        return self._size[self._find(label)]
+    def bbox(self, label):
+        return tuple(self._bbox[self._find(label)])
+    def representative(self, label):
+        # A fixed floor cell of the region: its first cell in row-major order.
+        i = self._first[self._find(label)]
+        return (i % self.dungeon.w, i // self.dungeon.w)
+    def regions(self):
+        # Region ids, largest first (ties by representative cell).
+        self._sync()
+        roots = [i for i in range(len(self._parent)) if self._parent[i] == i]
+        return sorted(roots, key=lambda r: (-self._size[r], self._first[r]))
+    def label_array(self):
+        # Per-cell region ids as an (h, w) int32 array, -1 on walls.
+        self._sync()
+        roots = np.array([self._find(i) for i in range(len(self._parent))] + [-1], np.int32)
+        return roots[self._labels]
+
+# One cellular-automaton smoothing pass: an interior cell becomes floor when at least `threshold` cells of
+# its 3x3 neighbourhood (itself included) are floor. Neighbours are counted by summing the nine shifted
+# views of the grid (a 3x3 box convolution); border cells are left unchanged.
+def smooth_cells(grid, threshold=5):
+    h, w = grid.shape
+    counts = np.zeros((h - 2, w - 2), np.uint8)
+    for dy in range(3):
+        for dx in range(3):
+            counts += grid[dy:h - 2 + dy, dx:w - 2 + dx]
+    out = grid.copy()
+    out[1:-1, 1:-1] = counts >= threshold
+    return out
+
+# Generator with four strategies. Each generate_* call takes an optional seed: with one, the call draws
+# from its own random.Random and is reproducible on its own; without one it uses the global `random`
+# module as before, so random.seed() still applies.
+# Every strategy is written as a step-wise iter_* generator that builds into a given Dungeon and yields
+# its progress (0..1) after each small unit of work; generate_* simply runs it to completion, and
+# StepwiseGeneration spreads one over many frames under a step or time budget.
+STRATEGIES = ("poi", "maze", "noise", "bsp")
+
 class DungeonGenerator:
-    def __init__(self, sett):
+    def __init__(self, sett=None):
+        if sett is None: sett = load_settings()
         self.w, self.h = sett["grid_width"], sett["grid_height"]
         self.min_path = sett["min_path_length"]
         self.noise_thresh = sett["noise_threshold"]
         self.bsp_min = sett["bsp_min_size"]
-    
-    def carve_random_corridor(self, d, start, end):
+        self.connect_noise_regions = sett.get("connect_regions", False)
+
+    @staticmethod
+    def _rng(seed):
+        return random if seed is None else random.Random(seed)
+
+    def generate(self, strategy, seed=None):
+        if strategy not in STRATEGIES: raise ValueError("unknown strategy %r" % strategy)
+        return getattr(self, "generate_" + strategy)(seed)
+
+    def stepwise(self, strategy, seed=None):
+        return StepwiseGeneration(self, strategy, seed)
+
+    def generate_async(self, jobs):
+        # Generate (strategy, seed) jobs on a background thread; see GenerationTask.
+        return GenerationTask(self, jobs)
+
+    def iter_random_corridor(self, d, start, end, rng=random):
+        # One carved cell per step; yields the share of the start-end Manhattan distance covered so far.
+        total = abs(end[0] - start[0]) + abs(end[1] - start[1]) or 1
+        covered = 0.0
         current = start
         while current != end:
             x, y = current
@@ -69,104 +730,132 @@ class DungeonGenerator:
             if y > end[1]:
                 candidates.append((x, y-1))
             # Introduce some lateral variation
-            if random.random() < 0.3:
+            if rng.random() < 0.3:
                 lateral = [(x+1, y), (x-1, y), (x, y+1), (x, y-1)]
                 candidates.extend(lateral)
             # Filter out moves that are off-grid
             candidates = [pos for pos in candidates if d.in_bounds(pos)]
-            current = random.choice(candidates)
+            current = rng.choice(candidates)
             d.carve(current)
+            covered = max(covered, 1 - (abs(end[0] - current[0]) + abs(end[1] - current[1])) / total)
+            yield covered
+
+    def carve_random_corridor(self, d, start, end, rng=random):
+        run_steps(self.iter_random_corridor(d, start, end, rng))
+
+    def iter_connect_regions(self, d):
+        # Join every floor region to the largest one with an L-shaped corridor walked from the region's
+        # representative cell towards the largest region's, in row-major order. Each corridor stops as soon
+        # as it reaches that region, and corridors crossing other regions merge them on the way, so later
+        # regions are often already connected. Deterministic for a given grid. One carved cell per step.
+        index = d.regions
+        regions = index.regions()
+        if len(regions) < 2: return
+        tx, ty = index.representative(regions[0])
+        others = sorted(regions[1:], key=index.representative)
+        for n, label in enumerate(others):
+            cx, cy = index.representative(label)
+            while not index.same_region((cx, cy), (tx, ty)):
+                if cx != tx: cx += 1 if cx < tx else -1
+                else: cy += 1 if cy < ty else -1
+                d.carve((cx, cy))
+                yield n / len(others)
+
+    def connect_regions(self, d):
+        run_steps(self.iter_connect_regions(d))
 
     # Strategy 1: POI Corridor
-    def generate_poi(self):
-        d = Dungeon(self.w, self.h)
+    def iter_poi(self, d, rng):
         start, end = (0, 0), (self.w - 1, self.h - 1)
         cur = start; d.carve(cur)
-        for _ in range(self.min_path):
-            dx, dy = random.choice([(1, 0), (-1, 0), (0, 1), (0, -1)])
+        for i in range(self.min_path):
+            dx, dy = rng.choice([(1, 0), (-1, 0), (0, 1), (0, -1)])
             nxt = (cur[0] + dx, cur[1] + dy)
             if d.in_bounds(nxt):
                 cur = nxt; d.carve(cur)
+            yield 0.1 * i / self.min_path
         # Replace the straight-line connection with our randomized corridor
-        self.carve_random_corridor(d, cur, end)
+        for f in self.iter_random_corridor(d, cur, end, rng): yield 0.1 + 0.8 * f
         d.start, d.end = start, end
         d.shortest_path = d.find_shortest_path(d.start, d.end)
-        return d
+
+    def generate_poi(self, seed=None):
+        return self.stepwise("poi", seed).finish()
 
     # Strategy 2: Maze via DFS/random walk
-    def generate_maze(self):
-        d = Dungeon(self.w, self.h)
-        start = (random.randrange(0, self.w, 2), random.randrange(0, self.h, 2))
+    def iter_maze(self, d, rng):
+        start = (rng.randrange(0, self.w, 2), rng.randrange(0, self.h, 2))
         d.start = start; d.carve(start)
+        cells, carved = ((self.w + 1) // 2) * ((self.h + 1) // 2), 1
         stack = [start]
         while stack:
             x, y = stack[-1]
             nbrs = []
             for dx, dy in [(2,0), (-2,0), (0,2), (0,-2)]:
                 nxt = (x+dx, y+dy)
-                if d.in_bounds(nxt) and d.grid[nxt[1]][nxt[0]]==0:
+                if d.in_bounds(nxt) and d.grid[nxt[1], nxt[0]]==0:
                     nbrs.append(nxt)
             if nbrs:
-                nxt = random.choice(nbrs)
+                nxt = rng.choice(nbrs)
                 mx, my = (x+nxt[0])//2, (y+nxt[1])//2
                 d.carve((mx,my)); d.carve(nxt); stack.append(nxt)
+                carved += 1
             else:
                 stack.pop()
+            yield 0.9 * carved / cells
         # Use BFS to choose farthest cell from start as end.
-        q = deque([start]); dist = {start: 0}
-        while q:
-            cur = q.popleft()
-            for dx, dy in [(1,0), (-1,0), (0,1), (0,-1)]:
-                nxt = (cur[0]+dx, cur[1]+dy)
-                if d.in_bounds(nxt) and d.grid[nxt[1]][nxt[0]]==1 and nxt not in dist:
-                    dist[nxt] = dist[cur] + 1; q.append(nxt)
-        farthest = start; maxd = 0
-        for pos, dval in dist.items():
-            if dval > maxd: maxd = dval; farthest = pos
-        d.end = farthest
+        d.end = d.pathfinder.farthest(start)
+        yield 0.95
         d.shortest_path = d.find_shortest_path(d.start, d.end)
-        return d
+
+    def generate_maze(self, seed=None):
+        return self.stepwise("maze", seed).finish()
+
     # Strategy 3: Noise-based terrain with smoothing.
-    def generate_noise(self):
-        d = Dungeon(self.w, self.h)
-        # Create a noise-based floorplan
-        for y in range(self.h):
-            for x in range(self.w):
-                d.grid[y][x] = 1 if random.random() > self.noise_thresh else 0
+    def iter_noise(self, d, rng):
+        # Create a noise-based floorplan in one draw, seeded from rng so the call stays reproducible
+        noise_rng = np.random.default_rng(rng.getrandbits(64))
+        d.grid = (noise_rng.random((self.h, self.w)) > self.noise_thresh).astype(np.uint8)
+        yield 0.1
         # Smooth the noise to form coherent areas
         for _ in range(2):
-            new = [[d.grid[y][x] for x in range(self.w)] for y in range(self.h)]
-            for y in range(1, self.h-1):
-                for x in range(1, self.w-1):
-                    cnt = sum(d.grid[ny][nx] for nx in range(x-1, x+2) for ny in range(y-1, y+2))
-                    new[y][x] = 1 if cnt >= 5 else 0
-            d.grid = new
+            d.grid = smooth_cells(d.grid)
+        yield 0.2
         start, end = (0, 0), (self.w - 1, self.h - 1)
         # Use the randomized corridor function to carve a winding connection
         d.carve(start)
-        self.carve_random_corridor(d, start, end)
+        for f in self.iter_random_corridor(d, start, end, rng): yield 0.2 + 0.4 * f
+        if self.connect_noise_regions:
+            for f in self.iter_connect_regions(d): yield 0.6 + 0.3 * f
         d.start, d.end = start, end
         d.shortest_path = d.find_shortest_path(d.start, d.end)
-        return d
+
+    def generate_noise(self, seed=None):
+        return self.stepwise("noise", seed).finish()
+
     # Strategy 4: BSP dungeon – partition, carve rooms, and connect centers.
-    def generate_bsp(self):
-        d = Dungeon(self.w, self.h)
+    # The partition uses an explicit stack (left/top half first, as the recursive version did), so map
+    # size is not limited by the recursion depth.
+    def iter_bsp(self, d, rng):
         rooms = []
-        def split(x, y, w, h):
+        area, covered = self.w * self.h or 1, 0
+        stack = [(0, 0, self.w, self.h)]
+        while stack:
+            x, y, w, h = stack.pop()
             if w < self.bsp_min*2 or h < self.bsp_min*2:
                 rx, ry = x+1, y+1; rw, rh = max(2, w-2), max(2, h-2)
                 rooms.append((rx, ry, rw, rh))
                 for i in range(rx, rx+rw):
                     for j in range(ry, ry+rh):
                         d.carve((i,j))
-                return
-            if w > h:
-                sx = random.randint(x+self.bsp_min, x+w-self.bsp_min)
-                split(x, y, sx-x, h); split(sx, y, x+w-sx, h)
+                covered += w * h
+            elif w > h:
+                sx = rng.randint(x+self.bsp_min, x+w-self.bsp_min)
+                stack.append((sx, y, x+w-sx, h)); stack.append((x, y, sx-x, h))
             else:
-                sy = random.randint(y+self.bsp_min, y+h-self.bsp_min)
-                split(x, y, w, sy-y); split(x, sy, w, y+h-sy)
-        split(0, 0, self.w, self.h)
+                sy = rng.randint(y+self.bsp_min, y+h-self.bsp_min)
+                stack.append((x, sy, w, y+h-sy)); stack.append((x, y, w, sy-y))
+            yield 0.6 * covered / area
         if rooms:
             first = rooms[0]
             last = rooms[-1]
@@ -182,44 +871,336 @@ class DungeonGenerator:
                     cx += 1 if cx < x2 else -1; d.carve((cx,cy))
                 while cy != y2:
                     cy += 1 if cy < y2 else -1; d.carve((cx,cy))
+                yield 0.6 + 0.3 * i / len(rooms)
         else:
             d.start, d.end = (0,0), (self.w-1, self.h-1)
         d.shortest_path = d.find_shortest_path(d.start, d.end)
+
+    def generate_bsp(self, seed=None):
+        return self.stepwise("bsp", seed).finish()
+
+def run_steps(steps):
+    # Drive a step-wise generator to completion without keeping its yielded values.
+    deque(steps, maxlen=0)
+
+# One strategy run spread over as many calls as needed. step() does work until max_steps steps or
+# max_seconds have been used (either may be None), then returns whether generation has finished; the
+# Dungeon being built is always available as `dungeon`, so partial results can be drawn. The final
+# shortest-path search runs as a single step.
+class StepwiseGeneration:
+    def __init__(self, generator, strategy, seed=None):
+        if strategy not in STRATEGIES: raise ValueError("unknown strategy %r" % strategy)
+        self.strategy = strategy
+        self.dungeon = Dungeon(generator.w, generator.h)
+        self.progress = 0.0
+        self.steps = 0
+        self.done = False
+        self._steps = getattr(generator, "iter_" + strategy)(self.dungeon, generator._rng(seed))
+    def step(self, max_steps=None, max_seconds=None):
+        if self.done: return True
+        deadline = None if max_seconds is None else time.perf_counter() + max_seconds
+        n = 0
+        for self.progress in self._steps:
+            n += 1
+            if (max_steps is not None and n >= max_steps) or (deadline is not None and time.perf_counter() >= deadline):
+                break
+        else:
+            self.done, self.progress = True, 1.0
+        self.steps += n
+        return self.done
+    def finish(self):
+        self.step()
+        return self.dungeon
+
+# Content-addressed on-disk cache of generated levels. A level is keyed by the SHA-256 of its strategy,
+# seed, the settings that affect generation and the file format version, and stored raw so loads can be
+# memory-mapped. Files are written to a temporary name and renamed into place, so concurrent workers
+# never see a partial file.
+GENERATION_SETTINGS = ("grid_width", "grid_height", "min_path_length", "noise_threshold", "bsp_min_size",
+                       "connect_regions")
+
+class DungeonCache:
+    def __init__(self, directory, sett=None, mmap=True):
+        if sett is None: sett = load_settings()
+        self.directory = directory
+        self.sett = sett
+        self.mmap = mmap
+        self.generator = DungeonGenerator(sett)
+        self.hits = self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+    def key(self, strategy, seed):
+        ident = {"strategy": strategy, "seed": seed, "version": DUNGEON_FORMAT_VERSION,
+                 "settings": {k: self.sett.get(k) for k in GENERATION_SETTINGS}}
+        return hashlib.sha256(json.dumps(ident, sort_keys=True).encode()).hexdigest()
+    def path(self, strategy, seed):
+        return os.path.join(self.directory, self.key(strategy, seed) + ".dgn")
+    def get(self, strategy, seed):
+        if seed is None: raise ValueError("only seeded levels can be cached")
+        path = self.path(strategy, seed)
+        try:
+            d = Dungeon.load(path, self.mmap)
+        except FileNotFoundError:
+            self.misses += 1
+            d = self.generator.generate(strategy, seed)
+            self.put(path, d)
+            return d
+        self.hits += 1
         return d
+    def put(self, path, d):
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f: f.write(d.to_bytes(packed=False))
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp); raise
+
+# An unbounded world of chunk_size x chunk_size Dungeons addressed by (seed, cx, cy). Each chunk is
+# generated on demand from its own RNG, so the same seed always yields the same chunk regardless of the
+# order chunks are visited in. Seams are stitched with portals: a chunk's outer ring is wall except for
+# one cell per edge, placed by an RNG keyed on the shared edge so both neighbours open the same cell,
+# and every portal is joined to the chunk centre by a winding corridor.
+# Live chunks are kept in an LRU of max_chunks entries; evicted chunks are written to a memory-mapped
+# slot file (a temporary file unless spill_path is given) and read back from there instead of being
+# regenerated, so carves made to a chunk survive eviction.
+class ChunkedWorld:
+    def __init__(self, seed, chunk_size=None, max_chunks=None, spill_path=None, sett=None):
+        if sett is None: sett = load_settings()
+        self.seed = seed
+        self.chunk_size = chunk_size or sett.get("chunk_size", 64)
+        self.max_chunks = max_chunks or sett.get("chunk_cache", 64)
+        self.generator = DungeonGenerator(sett)
+        self._chunks = OrderedDict()  # (cx, cy) -> Dungeon, least recently used first
+        self._slots = {}  # (cx, cy) -> slot index in the spill file
+        self._store = None
+        self._temporary = spill_path is None
+        if spill_path is None:
+            fd, spill_path = tempfile.mkstemp(suffix=".chunks"); os.close(fd)
+        self.spill_path = spill_path
+    def _rng(self, *key):
+        # String seeds are hashed with SHA-512 by random.Random, so this is stable across runs and processes.
+        return random.Random(":".join(str(k) for k in (self.seed,) + key))
+    def portal(self, side, cx, cy):
+        # Offset along the edge of the portal on the given side ("n", "s", "w", "e") of chunk (cx, cy).
+        # Edges are keyed by the chunk to their south/east, so neighbours agree on the shared one.
+        if side == "e": side, cx = "w", cx + 1
+        elif side == "s": side, cy = "n", cy + 1
+        return self._rng(side, cx, cy).randrange(1, self.chunk_size - 1)
+    def generate_chunk(self, cx, cy):
+        n = self.chunk_size
+        rng = self._rng(cx, cy)
+        d = Dungeon(n, n)
+        noise_rng = np.random.default_rng(rng.getrandbits(64))
+        grid = (noise_rng.random((n, n)) > self.generator.noise_thresh).astype(np.uint8)
+        for _ in range(2):
+            grid = smooth_cells(grid)
+        grid[0, :] = grid[-1, :] = grid[:, 0] = grid[:, -1] = 0
+        d.grid = grid
+        # Corridors are carved through a view of the interior so they never open the ring elsewhere.
+        inner = Dungeon(n - 2, n - 2)
+        inner.grid = grid[1:-1, 1:-1]
+        center = (n // 2 - 1, n // 2 - 1)
+        inner.carve(center)
+        north, south = self.portal("n", cx, cy), self.portal("s", cx, cy)
+        west, east = self.portal("w", cx, cy), self.portal("e", cx, cy)
+        for portal, entry in (((north, 0), (north - 1, 0)), ((south, n - 1), (south - 1, n - 3)),
+                              ((0, west), (0, west - 1)), ((n - 1, east), (n - 3, east - 1))):
+            d.carve(portal); inner.carve(entry)
+            self.generator.carve_random_corridor(inner, entry, center, rng)
+        d.start = d.end = (n // 2, n // 2)
+        return d
+    def chunk(self, cx, cy):
+        key = (cx, cy)
+        d = self._chunks.get(key)
+        if d is not None:
+            self._chunks.move_to_end(key)
+            return d
+        slot = self._slots.get(key)
+        if slot is None:
+            d = self.generate_chunk(cx, cy)
+        else:
+            d = Dungeon(self.chunk_size, self.chunk_size)
+            d.grid = np.array(self._store[slot])
+            d.start = d.end = (self.chunk_size // 2, self.chunk_size // 2)
+        self._chunks[key] = d
+        while len(self._chunks) > self.max_chunks:
+            self._spill(*self._chunks.popitem(last=False))
+        return d
+    def _spill(self, key, d):
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = len(self._slots)
+            if self._store is None or slot >= len(self._store):
+                self._grow(max(16, 2 * slot))
+        self._store[slot] = d.grid
+    def _grow(self, slots):
+        n = self.chunk_size
+        if self._store is not None:
+            self._store.flush(); self._store = None
+        with open(self.spill_path, "ab") as f:
+            f.truncate(slots * n * n)
+        self._store = np.memmap(self.spill_path, np.uint8, "r+", shape=(slots, n, n))
+    def chunk_of(self, pos):
+        # (chunk key, local position) for a world position; negative coordinates are fine.
+        (cx, x), (cy, y) = divmod(pos[0], self.chunk_size), divmod(pos[1], self.chunk_size)
+        return (cx, cy), (x, y)
+    def cell(self, pos):
+        (cx, cy), (x, y) = self.chunk_of(pos)
+        return int(self.chunk(cx, cy).grid[y, x])
+    def carve(self, pos):
+        (cx, cy), local = self.chunk_of(pos)
+        self.chunk(cx, cy).carve(local)
+    def window(self, x, y, w, h):
+        # A copy of the world cells in [x, x + w) x [y, y + h), assembled from the chunks it overlaps.
+        out = np.zeros((h, w), np.uint8)
+        n = self.chunk_size
+        for cy in range(y // n, (y + h - 1) // n + 1):
+            for cx in range(x // n, (x + w - 1) // n + 1):
+                x0, y0 = max(x, cx * n), max(y, cy * n)
+                x1, y1 = min(x + w, (cx + 1) * n), min(y + h, (cy + 1) * n)
+                grid = self.chunk(cx, cy).grid
+                out[y0 - y:y1 - y, x0 - x:x1 - x] = grid[y0 - cy * n:y1 - cy * n, x0 - cx * n:x1 - cx * n]
+        return out
+    def flush(self):
+        # Write every live chunk to the spill file (e.g. before handing the file to another process).
+        for key, d in self._chunks.items():
+            self._spill(key, d)
+        if self._store is not None: self._store.flush()
+    def close(self):
+        self._chunks.clear(); self._slots.clear()
+        self._store = None
+        if self._temporary and os.path.exists(self.spill_path): os.remove(self.spill_path)
+
+# Handle for generation running on a background thread, so a render loop can keep drawing meanwhile.
+# Jobs without a seed get one drawn from the global `random` at submission, keeping random.seed() in
+# effect without touching the global generator from the worker. The worker runs the step-wise strategies
+# in short slices, checking for cancel() and briefly releasing the GIL between slices; progress is the
+# overall fraction done. result() returns the list of Dungeons, all at once, so callers swap a whole
+# floor in with a single assignment.
+class GenerationTask:
+    SLICE = 0.002  # seconds of work between cancellation checks
+    def __init__(self, generator, jobs):
+        self.jobs = [(strategy, random.getrandbits(64) if seed is None else seed) for strategy, seed in jobs]
+        for strategy, _ in self.jobs:
+            if strategy not in STRATEGIES: raise ValueError("unknown strategy %r" % strategy)
+        self.generator = generator
+        self.completed = 0
+        self._cancel = threading.Event()
+        self._result = None
+        self._error = None
+        self._current = None
+        self._thread = threading.Thread(target=self._run, name="dungeon-generation", daemon=True)
+        self._thread.start()
+    def _run(self):
+        try:
+            out = []
+            for strategy, seed in self.jobs:
+                self._current = self.generator.stepwise(strategy, seed)
+                while not self._current.step(max_seconds=self.SLICE):
+                    if self._cancel.is_set(): return
+                    time.sleep(0)
+                out.append(self._current.dungeon)
+                self.completed += 1
+            self._result = out
+        except BaseException as e:
+            self._error = e
+    @property
+    def progress(self):
+        if not self.jobs: return 1.0
+        current = self._current
+        partial = current.progress if current is not None and not current.done else 0.0
+        return (self.completed + partial) / len(self.jobs)
+    def cancel(self):
+        self._cancel.set()
+    def cancelled(self):
+        return self._cancel.is_set() and self.done() and self._result is None
+    def done(self):
+        return not self._thread.is_alive()
+    def result(self, timeout=None):
+        self._thread.join(timeout)
+        if self._thread.is_alive(): raise TimeoutError("generation still running")
+        if self._error is not None: raise self._error
+        if self._result is None: raise CancelledError()
+        return self._result
+
+# Batch generation across a process pool. Every job is a (strategy, seed) pair and is generated from its
+# own seed, so the dungeons are bit-identical whatever the worker count or completion order. Results are
+# yielded as (index, Dungeon) in completion order while at most `workers * 4` jobs are in flight, which
+# keeps memory flat for very long job lists.
+_worker_generator = None
+
+def _init_worker(sett):
+    global _worker_generator
+    _worker_generator = DungeonGenerator(sett)
+
+def _generate_job(strategy, seed):
+    return _worker_generator.generate(strategy, seed)
+
+def generate_batch(jobs, workers=None, sett=None):
+    if sett is None: sett = load_settings()
+    workers = workers or os.cpu_count() or 1
+    jobs = iter(enumerate(jobs))
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(sett,)) as pool:
+        pending = {}
+        def submit(limit):
+            for index, (strategy, seed) in jobs:
+                if strategy not in STRATEGIES: raise ValueError("unknown strategy %r" % strategy)
+                pending[pool.submit(_generate_job, strategy, seed)] = index
+                if len(pending) >= limit: break
+        submit(workers * 4)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+            submit(workers * 4)
+
+# Demo: the four strategies side by side; SPACE regenerates, ESC quits.
+def main():
+    import pygame
+    pygame.init()
+    sett = load_settings()
+    # Prepare dungeons using different strategies.
+    gen = DungeonGenerator(sett)
+    d_poi = gen.generate_poi()
+    d_maze = gen.generate_maze()
+    d_noise = gen.generate_noise()
+    d_bsp = gen.generate_bsp()
+
+    sw, sh = sett["screen_width"], sett["screen_height"]
+    cell = sett["cell_size"]
+    screen = pygame.display.set_mode((sw, sh))
+    pygame.display.set_caption("Procedural Dungeon Generation Demo")
+    clock = pygame.time.Clock()
+    offsets = [(10,10), (sw//2+10,10), (10,sh//2+10), (sw//2+10,sh//2+10)]
+    dungeons = [d_poi, d_maze, d_noise, d_bsp]
+    labels = ["POI Corridor", "Maze DFS", "Noise-Based", "BSP Rooms"]
+    font = pygame.font.SysFont(None, 24)
+    task = None
+
+    running = True
+    while running:
+        for e in pygame.event.get():
+            if e.type == pygame.QUIT or (e.type==pygame.KEYDOWN and e.key==pygame.K_ESCAPE):
+                running = False
+            if e.type == pygame.KEYDOWN and e.key == pygame.K_SPACE and task is None:
+                # Regenerate in the background; the old floor stays on screen until the new one is ready.
+                task = gen.generate_async([(s, None) for s in ("poi", "maze", "noise", "bsp")])
+        if task is not None and task.done():
+            try: dungeons = task.result()
+            except CancelledError: pass
+            task = None
+        screen.fill((30,30,30))
+        for off, d, lab in zip(offsets, dungeons, labels):
+            d.draw(screen, off, cell)
+            txt = font.render(lab, True, (240,240,240))
+            screen.blit(txt, (off[0], off[1]-24))
+        if task is not None:
+            txt = font.render("Generating... %d%%" % (task.progress * 100), True, (240,240,240))
+            screen.blit(txt, (sw - txt.get_width() - 10, sh - 24))
+        pygame.display.flip()
+        clock.tick(30)
+    if task is not None: task.cancel()
+    pygame.quit()
 
-# Prepare dungeons using different strategies.
-gen = DungeonGenerator(sett)
-d_poi = gen.generate_poi()
-d_maze = gen.generate_maze()
-d_noise = gen.generate_noise()
-d_bsp = gen.generate_bsp()
-
-sw, sh = sett["screen_width"], sett["screen_height"]
-cell = sett["cell_size"]
-screen = pygame.display.set_mode((sw, sh))
-pygame.display.set_caption("Procedural Dungeon Generation Demo")
-clock = pygame.time.Clock()
-offsets = [(10,10), (sw//2+10,10), (10,sh//2+10), (sw//2+10,sh//2+10)]
-dungeons = [d_poi, d_maze, d_noise, d_bsp]
-labels = ["POI Corridor", "Maze DFS", "Noise-Based", "BSP Rooms"]
-font = pygame.font.SysFont(None, 24)
-
-running = True
-while running:
-    for e in pygame.event.get():
-        if e.type == pygame.QUIT or (e.type==pygame.KEYDOWN and e.key==pygame.K_ESCAPE):
-            running = False
-        if e.type == pygame.KEYDOWN and e.key == pygame.K_SPACE:
-            d_poi = gen.generate_poi()
-            d_maze = gen.generate_maze()
-            d_noise = gen.generate_noise()
-            d_bsp = gen.generate_bsp()
-            dungeons = [d_poi, d_maze, d_noise, d_bsp]
-    screen.fill((30,30,30))
-    for off, d, lab in zip(offsets, dungeons, labels):
-        d.draw(screen, off, cell)
-        txt = font.render(lab, True, (240,240,240))
-        screen.blit(txt, (off[0], off[1]-24))
-    pygame.display.flip()
-    clock.tick(30)
-pygame.quit(); sys.exit()
+if __name__ == "__main__":
+    main()
+    sys.exit()